@@ -1,30 +1,106 @@
+import time
+STARTUP_STARTED = time.perf_counter()   # used by --profile-startup to time the imports
+
 from tkinter import messagebox
-from PIL import Image
 import customtkinter as ctk
 from customtkinter import*
-import pygame
+import argparse
+import atexit
 import os
-import random
 import json
 import sys
-import copy
+from country_catalog import CountryCatalog, load_in_background
+from quiz_engine import QuizEngine, generate_series
+from flag_prefetcher import FlagPrefetcher, PREFETCH_DEPTH, decode_flag, flag_display_size
+from latency_probe import latency
+from audio_service import AudioService
+from view_state import ViewBatch
+from flag_cache import flag_cache, DEFAULT_QUALITY, QUALITY_TIERS
+from flag_manifest import FlagManifest
+import flag_manifest
+from player_stats import StatsStore, default_player
+from quiz_scheduler import QuizScheduler
+from country_pools import PoolIndex, PoolError, PRESET_POOLS
 
 # directory containing flag images
 FLAG_DIR = "flags"
 
+# time (in milliseconds) between answering a question and the next question
+NEXT_QUESTION_DELAY_MS = 1000
+
+# how often (in milliseconds) ask_questions checks again for a flag that is still being prefetched
+PREFETCH_POLL_MS = 20
+
+# speed round: time (in milliseconds) to answer each question, and between answering and the next question
+SPEED_ROUND_LIMIT_MS = 5000
+SPEED_ROUND_DELAY_MS = 300
+
+# how often (in milliseconds) the speed round countdown is updated
+COUNTDOWN_TICK_MS = 100
+
 # creating list of world regions
 regions = ["Africa", "Asia", "Caribbean", "Europe", "North America", "Oceania", "South America", "All Countries"]
 
+
+def find_flags(country_codes, manifest):
+    flags = [] # list of tuples that store the country code and path to the flag image
+
+    # loop through all country codes
+    for code in country_codes:
+        flag_path = manifest.path(code) # look up the flag image in the manifest (None if it is missing or bad)
+
+        # check if the country has a valid flag image
+        if flag_path is not None:
+            flags.append((code, flag_path)) # store the code and path to the flag image in a tuple
+
+    return flags
+
+
+def select_quiz_countries(engine, pools, stats, player, selection, num_questions, weakest_first):
+    # populate engine.country_ids with the countries with a flag in a region or custom pool (e.g. "Europe + Caribbean" or "letter:S") in random order
+    country_ids = pools.select(selection)
+
+    # look up the countries the player is weakest at so they are asked first
+    weakest = stats.weakest(player, engine.catalog.codes(country_ids), num_questions) if weakest_first else []
+    return engine.select_pool(country_ids, weakest)
+
+
+def prepare_quiz(engine, pools, stats, player, manifest, selection, num_answers, num_questions, weakest_first):
+    # everything start_quiz does apart from widgets, music and timers, returns the list of (country code, flag path) to ask
+    select_quiz_countries(engine, pools, stats, player, selection, num_questions, weakest_first)
+    engine.start(num_answers)   # set score and current question to 0 and set number of answer choices
+    return find_flags(engine.codes(), manifest)
+
+
 class CountryFlagsGame:
 
     # constructor
-    def __init__(self, root, data = None):
+    def __init__(self, root, data = None, prefetch_depth = PREFETCH_DEPTH, quality = DEFAULT_QUALITY, player = None):
         # set up window
         self.root = root    # get main window
         self.root.title("Country Flags Game")   # set window title
         self.root.geometry(f"{root.winfo_screenwidth()}x{root.winfo_screenheight()}")   # make window take up full screen
         self.root.resizable(False, False)   # make window non-resizable
 
+        # start reading the country data in the background (unless it was passed in) so it does not delay the window
+        self.catalog = CountryCatalog(data) if data is not None else None   # indexed, read-only view of the content of the JSON file
+        self.catalog_future = None  # holds the catalog while it is being read in the background
+        self.pools = None   # bitset indexes used to build custom pools of countries, created once the catalog is read
+        self.file_path = "AllCountries.json"    # file to be read
+
+        if self.catalog is None:
+            if os.path.exists(self.file_path):
+                self.read_json_file(self.file_path) # file found, start reading file
+            else:
+                messagebox.showerror("ERROR", f"File not found: {self.file_path}")  # file not found, display error message  
+                sys.exit()  # exit the program
+
+        # check the flag images in the background and report bad ones before they are needed
+        self.manifest = None    # maps country codes to valid flag images
+        self.manifest_future = flag_manifest.load_in_background(FLAG_DIR)
+        self.features = None    # flag feature vectors used by hard mode
+        self.features_future = None # holds the feature vectors while they are being loaded in the background
+
         # center align window
         root.update_idletasks() # force GUI update
         width = root.winfo_width()  # get window width
@@ -34,13 +110,27 @@ class CountryFlagsGame:
         root.geometry(f'{width}x{height}+{x}+{y}')  # set window size and position
 
         # variables
-        self.data = data    # a dictionary that will store the content of the JSON file
-        self.score = 0  # user score
+        self.quiz_started = False   # becomes True once the first quiz is started
         self.total_questions = 0    # total number of questions
-        self.current_question = 0   # current question number
-        self.num_answers = 4    # default number of answer choices
-        self.countries_dict = {}    # stores the data that maps a country's code to its name
-        self.correct_answer = None # stores the correct answer
+        self.flags = [] # list of tuples that store the country code and path to the flag image
+        self.quality = quality  # quality tier used to resize the flags ("fast", "balanced" or "best")
+        scaling = ctk.ScalingTracker.get_window_scaling(self.root)  # DPI scaling factor of the window
+        self.flag_size, self.flag_pixel_size = flag_display_size(root.winfo_screenwidth(), root.winfo_screenheight(), scaling)    # flag size in CTk units and in real pixels
+        self.prefetcher = FlagPrefetcher(depth=prefetch_depth, size=self.flag_pixel_size, quality=quality)  # decodes upcoming flags in the background
+        self.audio = AudioService() # plays music without blocking the UI thread
+        self.scheduler = QuizScheduler(self.root)   # owns every pending quiz callback and times them with a monotonic clock
+        self.speed_round = False    # True while a speed round is running
+        self.answered_at = None # scheduler time of the last answer (None before the first one)
+        self.question_deadline = None   # scheduler time the current question runs out in a speed round
+        self.response_times = []    # seconds the player took to answer each question of the quiz
+        self.flag_delays = []   # seconds from each answer to the next flag appearing
+        self.wait_started = None    # latency start time of waiting for a flag that is still being prefetched
+        self.player = player or default_player()    # name the statistics are saved under
+        self.stats = StatsStore()   # saves answers and scores without making the UI wait on disk I/O
+        self.quiz_region = None # region of the running quiz (the combo box is reset before the final score is saved)
+        self.question = None    # question currently shown
+        self.question_shown = None  # scheduler time the current question was shown, used for the response time
+        self.answered = True    # True once the current question has been answered (or timed out), later clicks are ignored
 
         # initialize flag label and answer choice buttons
         self.flag_label = ctk.CTkLabel(self.root, text="", fg_color="transparent", bg_color="transparent") # create a label that will display the flag image
@@ -49,14 +139,8 @@ class CountryFlagsGame:
         self.button3 = ctk.CTkButton(self.root, text="Button 3", width=375, height=50, command=lambda: self.check_answer(2), font=("System", 20), corner_radius=10, fg_color=("#3B8ED0","#1F6AA5"), text_color="white", hover_color="#093254")  # create a button
         self.button4 = ctk.CTkButton(self.root, text="Button 4", width=375, height=50, command=lambda: self.check_answer(3), font=("System", 20), corner_radius=10, fg_color=("#3B8ED0","#1F6AA5"), text_color="white", hover_color="#093254")  # create a button
 
-        # load country data
-        self.file_path = "AllCountries.json"    # file to be read
-
-        if os.path.exists(self.file_path):
-            self.read_json_file(self.file_path) # file found, read file
-        else:
-            messagebox.showerror("ERROR", f"File not found: {self.file_path}")  # file not found, display error message  
-            sys.exit()  # exit the program
+        # create the quiz engine that generates the questions and keeps score (it gets the catalog once it is loaded)
+        self.engine = QuizEngine(self.catalog)
 
         # add widgets to main window
         self.create_widgets()   # create other widgets
@@ -64,26 +148,120 @@ class CountryFlagsGame:
         # initialize score label
         self.score_label = ctk.CTkLabel(self.root, width=100, height=50, text="Questions Answered: 0 | Correct: 0 | Percentage: 0.00%") # create score label
         self.score_label.configure(font=("System", 20), fg_color="slategray4", text_color="white", corner_radius=20)    # customize look
-        self.score_label.grid(row=6, column=0, columnspan=5, pady=10)   # add and position score label
+
+        # track the state of the widgets that change every question so only real changes are applied, once per frame
+        self.views = ViewBatch(self.root)
+        self.button_views = [self.views.add(button, text=f"Button {index + 1}", state="normal", fg_color=("#3B8ED0","#1F6AA5"), text_color="white", hover_color="#093254") for index, button in enumerate([self.button1, self.button2, self.button3, self.button4])]
+        self.flag_view = self.views.add(self.flag_label)
+        self.score_view = self.views.add(self.score_label, text="Questions Answered: 0 | Correct: 0 | Percentage: 0.00%")
+        self.timer_label = ctk.CTkLabel(self.root, width=100, height=40, text="", font=("System", 20), fg_color="slategray4", text_color="white", corner_radius=20)   # speed round countdown
+        self.timer_view = self.views.add(self.timer_label, text="")
+        latency.add_counters("widget_updates", self.views.stats)    # report how many redraws were saved
+        latency.add_counters("flag_cache", flag_cache.stats)
+        latency.add_counters("player_stats", self.stats.stats)
+        latency.add_counters("scheduler", self.scheduler.stats)
+
+        self.score_view.grid(row=6, column=0, columnspan=5, pady=10)   # add and position score label
 
         # hide all buttons initially
         self.hide_buttons()
 
+        # initialize the mixer and decode the music in the background once the window is up
+        self.root.after_idle(self.audio.start)
+
+        # open the statistics database once the window is up, and write what is still queued on exit
+        self.root.after_idle(self.stats.start)
+        atexit.register(self.stats.close)
+
 
     def read_json_file(self, file_path):
-        # open and read the JSON file into a dictionary
+        # start reading the JSON file into a catalog on a background thread
+        self.catalog_future = load_in_background(file_path)
+
+
+    def wait_for_catalog(self):
+        # return the catalog, only waits if the background read has not finished yet
+        if self.catalog is not None or self.catalog_future is None:
+            return self.catalog
+
+        file_path = self.file_path
         try:
-            # open and read the file
-            with open(file_path, "r") as file:
-                self.data = json.load(file) # store the result in the dictionary self.data
+            # get the result of reading the file
+            self.catalog = self.catalog_future.result()  # store the result in the catalog self.catalog
+            self.engine.catalog = self.catalog  # hand the catalog to the quiz engine
         except FileNotFoundError:
             print(f"ERROR: The file at {file_path} was not found")  # file not found, print error message
         except json.JSONDecodeError:
             print(f"ERROR: The file could not be decoded. Check if it's a valid JSON file.")    # file is not a valid JSON, print error message
         except Exception as e:
             print(f"An unexpected error occurred: {e}") # some exception is thrown, print error message
+        self.catalog_future = None  # the result has been collected
+
+        return self.catalog
     
 
+    def wait_for_pools(self):
+        # return the pool index, building it the first time it is needed (pools only contain countries with a valid flag image)
+        if self.pools is None:
+            catalog = self.wait_for_catalog()
+            flag_codes = [code for code, flag_path in find_flags(catalog.country_codes, self.wait_for_manifest())]
+            self.pools = PoolIndex(catalog, self.missed_last_time, flag_codes)
+        return self.pools
+
+
+    def missed_last_time(self):
+        # return the codes of the countries the player got wrong the last time they were asked
+        return self.stats.missed_last_time(self.player, self.catalog.country_codes)
+
+
+    def count_countries(self, selection):
+        # return the number of countries with a flag in a region or custom pool (e.g. "Europe + Caribbean"), raises PoolError for an invalid pool
+        return self.wait_for_pools().count(selection)
+
+
+    def wait_for_manifest(self):
+        # return the flag manifest, only waits if the background check has not finished yet
+        if self.manifest is None:
+            try:
+                self.manifest = self.manifest_future.result()
+            except Exception as e:
+                # manifest could not be loaded or saved, check the images without it
+                print(f"Error loading flag manifest: {e}")  # print error message
+                self.manifest = FlagManifest(FLAG_DIR)
+                self.manifest.refresh()
+
+            # map the pre-scaled flags if they were built (see flag_bundle.py), flags missing from it are read from the PNGs
+            from flag_bundle import FlagBundle, BUNDLE_FILE # imported here, the bundle is only opened once the manifest is ready
+            flag_cache.bundle = FlagBundle.open(BUNDLE_FILE, self.manifest)
+            if flag_cache.bundle is not None:
+                latency.add_counters("flag_bundle", flag_cache.bundle.stats)
+        return self.manifest
+
+
+    def toggle_hard_mode(self):
+        # start loading the flag feature vectors as soon as hard mode is turned on, so they are ready when the quiz starts
+        if self.hard_mode_var.get() and self.features is None and self.features_future is None:
+            try:
+                import flag_features    # needs numpy, which is only required for hard mode
+            except ImportError as e:
+                print(f"ERROR: Hard mode is not available: {e}")  # print error message
+                self.hard_mode_var.set(False)
+                return
+            self.features_future = flag_features.load_in_background(self.wait_for_manifest())
+
+
+    def wait_for_features(self):
+        # return the flag feature vectors, only waits if the background load has not finished yet
+        if self.features is None and self.features_future is not None:
+            try:
+                self.features = self.features_future.result()
+            except Exception as e:
+                print(f"Error loading flag features, hard mode is off: {e}")  # print error message
+                self.hard_mode_var.set(False)
+            self.features_future = None # the result has been collected
+        return self.features
+
+
     def create_widgets(self):
         # create a label frame for the region, number of answer choices, and number of questions
         input_frame = ctk.CTkFrame(self.root, fg_color="slategray4") # create label frame
@@ -99,8 +277,9 @@ class CountryFlagsGame:
         ctk.CTkLabel(input_frame, text="Region", font=("System", 18), fg_color="transparent", text_color="black").grid(row=0, column=0) # create and postion label for region
 
         # add combo box for region
-        self.region_combo = ctk.CTkComboBox(input_frame, variable=self.region, state="readonly", width=140, command=self.load_num_of_questions)   # create combo box whose result is stored in self.region
-        self.region_combo.configure(values=regions)   # populate combo box so options are items found in the list self.regions
+        self.region_combo = ctk.CTkComboBox(input_frame, variable=self.region, width=140, command=self.load_num_of_questions)   # create combo box whose result is stored in self.region
+        self.region_combo.configure(values=regions + PRESET_POOLS)   # populate combo box with the regions and some custom pools, other pools can be typed in
+        self.region_combo.bind("<Return>", self.load_num_of_questions)  # update the number of questions for a typed pool
         self.region_combo.configure(font=("System", 18), dropdown_font=("System", 18), fg_color=("#3B8ED0","#1F6AA5"), border_color=("#3B8ED0","#1F6AA5"), button_color=("#36719F", "#144870")) # customize look
         self.region_combo.grid(row=1, column=0, padx=35, pady=5, sticky="w")  # add and position combo box
         self.region_combo.set("Select a Region")    # set default text on combo box
@@ -124,6 +303,21 @@ class CountryFlagsGame:
         self.num_of_questions = ctk.CTkOptionMenu(input_frame, variable=self.num_questions_var, values=num_question_options)    # create CTkOptionMenu whose result is stored in self.num_questions_var
         self.num_of_questions.configure(font=("System", 18), dropdown_font=("System", 18))  # customize look
         self.num_of_questions.grid(row=1, column=2, padx=35, pady=5, sticky="e") # add and position CTkOptionMenu
+
+        # add check box for hard mode (wrong answers are flags that look like the correct one)
+        self.hard_mode_var = ctk.BooleanVar(value=False)
+        self.hard_mode_check = ctk.CTkCheckBox(input_frame, text="Hard Mode", variable=self.hard_mode_var, command=self.toggle_hard_mode, font=("System", 18), text_color="black")  # create check box whose result is stored in self.hard_mode_var
+        self.hard_mode_check.grid(row=2, column=0, padx=35, pady=10, sticky="w")  # add and position check box
+
+        # add check box to ask the countries the player got wrong most often first
+        self.weakest_first_var = ctk.BooleanVar(value=False)
+        self.weakest_first_check = ctk.CTkCheckBox(input_frame, text="Weakest First", variable=self.weakest_first_var, font=("System", 18), text_color="black")  # create check box whose result is stored in self.weakest_first_var
+        self.weakest_first_check.grid(row=2, column=2, padx=35, pady=10, sticky="e")  # add and position check box
+
+        # add check box for a speed round (every question has to be answered within SPEED_ROUND_LIMIT_MS)
+        self.speed_round_var = ctk.BooleanVar(value=False)
+        self.speed_round_check = ctk.CTkCheckBox(input_frame, text=f"Speed Round ({SPEED_ROUND_LIMIT_MS // 1000}s)", variable=self.speed_round_var, font=("System", 18), text_color="black")  # create check box whose result is stored in self.speed_round_var
+        self.speed_round_check.grid(row=3, column=0, padx=35, pady=(0, 10), sticky="w")  # add and position check box
         
         # add start button
         self.start_button = ctk.CTkButton(input_frame, text="START QUIZ", command=self.start_quiz, font=("System", 18), width=50)  # create start button
@@ -137,8 +331,11 @@ class CountryFlagsGame:
     def load_num_of_questions(self, event):
         selected_region = self.region.get() # get the region
 
-        region_data = copy.deepcopy(self.data[selected_region]) # get the info (code and name) of the countries in the selected region
-        max_entries = len(region_data)  # get the number of countries in the selected region
+        # get the number of countries with a flag in the selected region or pool
+        try:
+            max_entries = self.count_countries(selected_region)
+        except PoolError:
+            return  # not a valid pool (yet), start_quiz reports the error
         self.update_option_menu(max_entries)    # update option menu
 
 
@@ -154,79 +351,52 @@ class CountryFlagsGame:
         
 
     def generate_series(self, max_value):
-        # handle cases where max_value is less than 10
-        if max_value < 10:
-            return [str(max_value)] # return a list with 1 option: max_value
-        
-        # handle cases where max_value is between 10 and 20 (exclusive)
-        if max_value < 20:
-            return [str(5), str(10), str(max_value)]    # return a list with 3 options: 5, 10, and max_value
-        
-        # base series for values greater than or equal to 20
-        base_series = [5, 10, 20, 30]  # list of base options
-
-        # handle case where max_value is less than or equal to the last element in base_series
-        if max_value <= base_series[-1]:
-            # create a series with values from base_series that are less than max_value
-            series = [x for x in base_series if x < max_value]
-
-            # append max_value to the series
-            series.append(max_value)
-        else:
-            # extend the base series to include max_value
-            series = base_series + [max_value]
-
-        # ensure the series contains no more than five elements
-        while len(series) > 5:
-            series.pop(0)   # discard the first element in the series
-        
-        return [str(num) for num in series] # return the series as strings
+        # get the possible options for number of questions from the quiz engine
+        return generate_series(max_value)
 
 
     def hide_buttons(self):
         # hide all answer choice buttons
-        self.button1.grid_forget()  # hide button1
-        self.button2.grid_forget()  # hide button2
-        self.button3.grid_forget()  # hide button3
-        self.button4.grid_forget()  # hide button4
+        for button_view in self.button_views:
+            button_view.grid_forget()   # hide button
 
 
     def show_buttons(self):
         self.hide_buttons() # hide all buttons before showing specific ones
         
-        if self.num_answers == 1:
+        if self.engine.num_answers == 1:
             # show 1 button
-            self.button1.grid(row=3, column=1, pady=20)
+            self.button_views[0].grid(row=3, column=1, pady=20)
 
             # reposition score label
-            self.score_label.grid(row=6, column=0, columnspan=5, pady=20)
+            self.score_view.grid(row=6, column=0, columnspan=5, pady=20)
 
-        elif self.num_answers == 2:
+        elif self.engine.num_answers == 2:
             # show 2 buttons
-            self.button1.grid(row=3, column=1, padx=0, pady=20, sticky="w")
-            self.button2.grid(row=3, column=1, padx=0, pady=20, sticky="e")
+            self.button_views[0].grid(row=3, column=1, padx=0, pady=20, sticky="w")
+            self.button_views[1].grid(row=3, column=1, padx=0, pady=20, sticky="e")
 
             # reposition score label
-            self.score_label.grid(row=6, column=0, columnspan=5, pady=20)
+            self.score_view.grid(row=6, column=0, columnspan=5, pady=20)
 
-        elif self.num_answers == 3:
+        elif self.engine.num_answers == 3:
             # show 3 buttons
-            self.button1.grid(row=3, column=1, padx=0, pady=20, sticky="w")
-            self.button2.grid(row=3, column=1, padx=300, pady=20)
-            self.button3.grid(row=3, column=1, padx=0, pady=20, sticky="e")
+            self.button_views[0].grid(row=3, column=1, padx=0, pady=20, sticky="w")
+            self.button_views[1].grid(row=3, column=1, padx=300, pady=20)
+            self.button_views[2].grid(row=3, column=1, padx=0, pady=20, sticky="e")
 
             # reposition score label
-            self.score_label.grid(row=6, column=0, columnspan=5, pady=20)
+            self.score_view.grid(row=6, column=0, columnspan=5, pady=20)
 
-        elif self.num_answers == 4:
+        elif self.engine.num_answers == 4:
             # show 4 buttons
-            self.button1.grid(row=3, column=1, padx=0, pady=20, sticky="w")
-            self.button2.grid(row=3, column=1, padx=0, pady=20, sticky="e")
-            self.button3.grid(row=4, column=1, padx=0, pady=0, sticky="w")
-            self.button4.grid(row=4, column=1, padx=0, pady=0, sticky="e")
+            self.button_views[0].grid(row=3, column=1, padx=0, pady=20, sticky="w")
+            self.button_views[1].grid(row=3, column=1, padx=0, pady=20, sticky="e")
+            self.button_views[2].grid(row=4, column=1, padx=0, pady=0, sticky="w")
+            self.button_views[3].grid(row=4, column=1, padx=0, pady=0, sticky="e")
 
             # reposition score label
-            self.score_label.grid(row=6, column=0, columnspan=5, pady=40)
+            self.score_view.grid(row=6, column=0, columnspan=5, pady=40)
 
 
     def start_quiz(self):
@@ -237,69 +407,53 @@ class CountryFlagsGame:
             # a region was not selected
             messagebox.showerror("ERROR", "Select a Region!")   # display error message
             return
-        
+
+        # check if a custom pool is valid and has countries
+        try:
+            pool_size = self.count_countries(selected_region)
+        except PoolError as e:
+            messagebox.showerror("ERROR", f"Invalid pool: {e}")  # display error message
+            return
+        if pool_size == 0:
+            messagebox.showerror("ERROR", f"There are no countries with a flag in {selected_region}!")  # display error message
+            return
+        if int(self.num_questions_var.get()) > pool_size:
+            self.update_option_menu(pool_size)  # the pool was typed without pressing enter, fit the number of questions to it
+
+        # drop callbacks left over from a quiz that was not reset
+        self.scheduler.cancel_all()
+        self.wait_started = None    # a wait for a flag of the previous quiz is not timed
+        self.answered = True    # no question is shown yet
+        self.timer_view.grid_forget()   # hide the countdown (or "Time's up!") of a previous speed round
+
         # play music
         self.start_music()
+        self.quiz_started = True
+        self.quiz_region = selected_region
+        self.speed_round = self.speed_round_var.get()
+        self.answered_at = None
+        self.response_times = []
+        self.flag_delays = []
         
         # get questions for selected region, data is already randomized
         num_questions = int(self.num_questions_var.get())   # get number of questions
-        self.get_countries_by_region(selected_region)    # populate self.countries_dict with countries in the selected region (key=country code and value=country name)
+        self.engine.features = self.wait_for_features() if self.hard_mode_var.get() else None   # similar flags as wrong answers in hard mode
 
-        # set initial values
-        self.current_question = 0   # set current question to 0
-        self.score = 0  # set score to 0
-        self.num_answers = int(self.num_answers_var.get())  # get number of answer choices
-        self.load_images() # load flag images
+        # pick the countries of the selected region, start the engine and look up the flag images
+        self.flags = prepare_quiz(self.engine, self.wait_for_pools(), self.stats, self.player, self.wait_for_manifest(), selected_region, int(self.num_answers_var.get()), num_questions, self.weakest_first_var.get())
+        self.load_images() # start decoding the flag images
         self.start_new_challenge()  # update the screen with buttons and score board
         self.ask_questions(num_questions)   # start asking questionss
 
     
     def get_countries_by_region(self, region_name):
-        self.countries_dict = {} # reset dictionary's contents
-
-        # check if selected region is in dictionary self.data
-        if region_name in self.data:
-            # region found in dictionary
-            region_data = copy.deepcopy(self.data[region_name]) # make a deep copy of that region's data
-
-            # populate self.countries_dict with countries in the selected region
-            for _ in range(len(region_data) + 1):
-                # check if region_data is empty
-                if not region_data:
-                    # region_data is empty
-                    break   # exit for loop
-                
-                count = len(region_data)    # get current number of countries in region_data
-                index = random.randint(0, count-1)  # generate a random index
-                item = region_data[index]   # get country (country code and country name) at specified index 
-                self.countries_dict[item["country_code"]] = item["country_name"] # map item's country code to its country name in self.countries_dict
-                region_data.pop(index)  # remove the country at the specified index from region_data (prevent duplicates)
-        else:
-            # region does not exist, return an empty dictionary
-            return {}
+        # populate self.engine.country_ids with the ids of the countries in the selected region (the pool index waits for the country data)
+        return select_quiz_countries(self.engine, self.wait_for_pools(), self.stats, self.player, region_name, int(self.num_questions_var.get()), self.weakest_first_var.get())
 
 
     def load_images(self):
-        self.flags = [] # list of tuples that store the country code and path to the flag image
-
-        # get list of all filenames in FLAG_DIR
-        filenames = [f.lower() for f in os.listdir(FLAG_DIR) if f.endswith(".png")]
-
-        # extract country codes from self.countries_dict
-        country_codes = self.countries_dict.keys()
-
-        # loop through all country codes
-        for code in country_codes:
-            filename = f"{code.lower()}.png"    # construct the expected filename
-            
-            # check if filename is found in list filenames
-            if filename in filenames:
-                try:
-                    # store the code and path to the flag image in a tuple
-                    self.flags.append((code, os.path.join(FLAG_DIR, filename)))
-                except Exception as e:
-                    # exception is thrown
-                    print(f"Error loading image {filename}: {e}")   # print error message
+        # start decoding the first flags of self.flags in the background
+        self.prefetcher.start(self.flags)
     
 
     def start_new_challenge(self):
@@ -310,17 +464,35 @@ class CountryFlagsGame:
     def update_score_board(self):
         num_questions_value = int(self.num_questions_var.get()) # get number of questions
 
-        percentage = (self.score / num_questions_value) * 100   # calculate score as a percentage
-        self.score_label.configure(text=f"Questions Answered: {self.current_question} | Correct: {self.score} | Percentage: {percentage:.2f}%")   # update score label
+        percentage = (self.engine.score / num_questions_value) * 100   # calculate score as a percentage
+        self.score_view.set(text=f"Questions Answered: {self.engine.current_question} | Correct: {self.engine.score} | Percentage: {percentage:.2f}%")   # update score label
 
 
     def ask_questions(self, num_questions):
         # check if question cap has been reached
-        if self.current_question >= num_questions:
+        if self.engine.current_question >= num_questions:
             # question cap reached
             self.show_final_score() # display final score
             self.reset_quiz()   # reset the quiz
             return
+
+        # get the decoded flag image from the prefetcher
+        pil_image = self.prefetcher.get(self.engine.current_question)
+        if pil_image is None:
+            # check if the flag is still being decoded in the background
+            if self.prefetcher.is_pending(self.engine.current_question):
+                if self.wait_started is None:
+                    self.wait_started = latency.begin() # start timing the wait for the flag
+                self.scheduler.schedule("next_question", PREFETCH_POLL_MS, self.ask_questions, num_questions)   # check again shortly
+                return
+
+            # flag could not be prefetched, decode it here instead
+            flag_code, flag_path = self.flags[self.engine.current_question]
+            pil_image = decode_flag(flag_code, flag_path, self.flag_pixel_size, self.quality)
+
+        # record how long the flag was waited for
+        latency.end("prefetch_wait", self.wait_started)
+        self.wait_started = None
         
         # update score board
         self.update_score_board()
@@ -328,47 +500,53 @@ class CountryFlagsGame:
         # re-enable all buttons for normal operation
         self.enable_buttons()
 
-        option_list = []    # list that will store the answer choices
-
-        # update question number
-        self.current_question += 1
-
-        # get a country from the region
-        flag_code, flag_path = self.flags[self.current_question-1]  # get country's code and path and store in flag_code and flag_path respectively
-        correct_country = self.countries_dict[flag_code]    # store name of correct country 
-
-        country_list = list(self.countries_dict.values())   # get values (country names) of self.countries_dict
-        country_list.remove(correct_country)    # remove the current country from the list
-        option_list.append(correct_country) # add the current country to the list of answer choices
-
-        # get other answer choices and remove possibility of duplicates
-        for _ in range(self.num_answers-1):
-            # check if country_list is empty
-            if not country_list:
-                # country_list is empty
-                break   # exit for loop
-            
-            # get another answer choice
-            index = random.randint(0, len(country_list)-1)  # generate a random number for the index
-            option_list.append(country_list[index]) # add the country at the specified index to option_list
-            country_list.remove(country_list[index]) # remove the country at the specified index from country_list to prevent duplicates
-
-        # shuffle the answer choices and determine the correct answer
-        random.shuffle(option_list) # shuffle the answer choices
-        self.correct_answer = option_list.index(correct_country)    # get index of correct answer
-
-        # load and display the flag image
-        pil_image = Image.open(flag_path)   # load flag image into PIL Image object
-        pil_image = pil_image.resize((650, 420), Image.LANCZOS) # resize image and maintain high quality
-        self.flag_image = ctk.CTkImage(light_image=pil_image, dark_image=pil_image, size=(650, 420)) # convert PILImage object into CTkImage object to display on CTkinter widget (self.flag_label)
-        self.flag_label.configure(image=self.flag_image)    # update label by setting its image to self.flag_image
-        self.flag_label.grid(row=2, column=0, columnspan=5, padx=10, pady=5, sticky="n")   # add and position label on window
+        # get a country from the region and build its shuffled answer choices (this also updates the question number)
+        flag_code = self.flags[self.engine.current_question][0]  # get country's code
+        self.question = self.engine.next_question(self.catalog.ids[flag_code])
+        self.answered = False
+        option_list = self.catalog.names(self.question.options)  # list that stores the answer choices
+        self.show_question(pil_image, option_list)
+
+        # apply the new flag and answer choices now and let Tk redraw them, so the times below include the configure and redraw
+        self.views.flush()
+        self.root.update_idletasks()
+
+        # record the time from the answer to the next flag appearing
+        self.question_shown = self.scheduler.now()  # start timing the player's answer
+        if self.answered_at is not None:
+            self.flag_delays.append(self.question_shown - self.answered_at)
+            latency.record("click_to_next_flag", self.question_shown - self.answered_at)
+
+        # in a speed round, start the countdown for this question
+        if self.speed_round:
+            self.question_deadline = self.scheduler.schedule_at("time_limit", self.question_shown + SPEED_ROUND_LIMIT_MS / 1000, self.check_answer, None)
+            self.update_countdown(0)
+
+
+    def show_question(self, pil_image, option_list):
+        # display the flag image
+        started = latency.begin()
+        self.flag_image = ctk.CTkImage(light_image=pil_image, dark_image=pil_image, size=self.flag_size) # convert PILImage object into CTkImage object to display on CTkinter widget (self.flag_label)
+        latency.end("ctk_image", started)
+        started = latency.begin()
+        self.flag_view.set(image=self.flag_image)    # update label by setting its image to self.flag_image
+        self.flag_view.grid(row=2, column=0, columnspan=5, padx=10, pady=5, sticky="n")   # add and position label on window
 
         # put answer choices on buttons
-        self.button1.configure(text=option_list[0] if len(option_list) > 0 else "")    # update button1
-        self.button2.configure(text=option_list[1] if len(option_list) > 1 else "")    # update button2
-        self.button3.configure(text=option_list[2] if len(option_list) > 2 else "")    # update button3
-        self.button4.configure(text=option_list[3] if len(option_list) > 3 else "")    # update button4
+        for index, button_view in enumerate(self.button_views):
+            button_view.set(text=option_list[index] if len(option_list) > index else "")   # update button
+        latency.end("configure", started)
+
+
+    def update_countdown(self, tick):
+        # show the time left in a speed round, ticks are counted from when the question was shown so they do not drift
+        remaining = self.scheduler.remaining("time_limit")
+        self.timer_view.set(text=f"Time left: {remaining:.1f}s")
+        self.timer_view.grid(row=5, column=0, columnspan=5, pady=(10, 0))
+
+        next_tick = self.question_shown + (tick + 1) * COUNTDOWN_TICK_MS / 1000
+        if next_tick < self.question_deadline:
+            self.scheduler.schedule_at("countdown", next_tick, self.update_countdown, tick + 1)
 
 
     def show_final_score(self):
@@ -376,120 +554,202 @@ class CountryFlagsGame:
         self.stop_music()
 
         # play congratulations song
-        music_file = "songs/congratulations.mp3"  # path to music file
-        pygame.mixer.music.load(music_file) # load mixer with music file
-        pygame.mixer.music.play(1) # play music file once
-        pygame.mixer.music.fadeout(8500)    # play music file for 8.5 seconds
+        self.audio.play("congratulations", loops=1) # play music file once
+        self.audio.fadeout(8500)    # play music file for 8.5 seconds
 
         num_questions = int(self.num_questions_var.get())   # get number of questions
-        percentage = (self.score / num_questions) * 100 # calculate score as a percentage
-        messagebox.showinfo("Quiz Completed", f"Final Score: {self.score}/{num_questions}\nPercentage: {percentage:.2f}%")  # display that quiz was completed and stats
-        self.score_label.configure(text=f"Questions Answered: {num_questions} | Correct: {self.score} | Percentage: {percentage:.2f}%") # update score label
+        percentage = (self.engine.score / num_questions) * 100 # calculate score as a percentage
+        self.stats.record_quiz(self.player, self.quiz_region, num_questions, self.engine.num_answers, self.engine.score)   # save the final score
+        message = f"Final Score: {self.engine.score}/{num_questions}\nPercentage: {percentage:.2f}%"
+        if self.speed_round and self.response_times:
+            # add the answer times and how quickly the next flag followed each answer
+            message += f"\nAverage answer time: {sum(self.response_times) / len(self.response_times):.2f}s"
+            if self.flag_delays:
+                mean_delay = sum(self.flag_delays) / len(self.flag_delays) * 1000
+                message += f"\nAnswer to next flag: {mean_delay:.0f} ms average, {max(self.flag_delays) * 1000:.0f} ms worst ({SPEED_ROUND_DELAY_MS} ms planned)"
+        messagebox.showinfo("Quiz Completed", message)  # display that quiz was completed and stats
+        self.score_view.set(text=f"Questions Answered: {num_questions} | Correct: {self.engine.score} | Percentage: {percentage:.2f}%") # update score label
+
+        # write the latency histograms of this session (only if recording is enabled)
+        latency.export()
 
 
     def check_answer(self, selected_option):
+        # ignore clicks (or a time limit) queued behind the answer that already counted
+        if self.answered:
+            return
+        self.answered = True
+
+        # selected_option is None when the time of a speed round question ran out
+        self.answered_at = self.scheduler.now() # start timing until the next flag appears
+        self.scheduler.cancel("time_limit")
+        self.scheduler.cancel("countdown")
+        response_time = self.answered_at - self.question_shown
+        self.response_times.append(response_time)
+        if selected_option is None:
+            self.timer_view.set(text="Time's up!")
+
         # disable all buttons to prevent spamming
         self.disable_buttons()
 
         # reset all button colors to default color
         self.reset_button_colors()
 
-        # check if self.correct_answer is a valid index
-        if 0 <= self.correct_answer < self.num_answers:
-            # self.correct_answer is a valid index
-            correct_button = [self.button1, self.button2, self.button3, self.button4][self.correct_answer]  # determine which button has the correct answer
+        # check if self.engine.correct_answer is a valid index
+        if 0 <= self.engine.correct_answer < self.engine.num_answers:
+            # self.engine.correct_answer is a valid index
+            correct_button = self.button_views[self.engine.correct_answer]  # determine which button has the correct answer
         else:
-            # self.correct_answer is not a valid index
-            print(f"Invalid correct_answer index: {self.correct_answer}")   # print error message
+            # self.engine.correct_answer is not a valid index
+            print(f"Invalid correct_answer index: {self.engine.correct_answer}")   # print error message
             return
         
         # color the correct button green
-        correct_button.configure(fg_color="#2FA572", hover_color="#2FA572")
+        correct_button.set(fg_color="#2FA572", hover_color="#2FA572")
 
-        # check if the selected button is correct or not
-        if selected_option == self.correct_answer:
-            # selected button is correct
-            self.score += 1 # add to score
-        else:
+        # check if the selected button is correct or not (the engine adds to the score if it is)
+        correct = self.engine.answer(selected_option)
+        if not correct and selected_option is not None:
             # selected button is wrong, color button red
-            [self.button1, self.button2, self.button3, self.button4][selected_option].configure(fg_color="#E74747", hover_color="#E74747")
+            self.button_views[selected_option].set(fg_color="#E74747", hover_color="#E74747")
+
+        # save the answer and how long it took (written in the background)
+        self.stats.record_answer(self.player, self.quiz_region, self.catalog.country_codes[self.question.country], correct, response_time * 1000)
 
         # update score board
         self.update_score_board()
 
-        # wait for 1 second and then call self.reset_button_colors
-        self.root.after(1000, self.reset_button_colors)
-
-        # ask next question
+        # after a short delay, reset the button colors and ask the next question (the delay counts from the answer, not from when the callback runs)
         num_questions = self.num_questions_var.get()  # get number of questions
-        self.root.after(1000, self.ask_questions, int(num_questions))   # call self.ask_questions after 1 second
+        self.scheduler.schedule_at("next_question", self.answered_at + (SPEED_ROUND_DELAY_MS if self.speed_round else NEXT_QUESTION_DELAY_MS) / 1000, self.next_question, int(num_questions))
+
+
+    def next_question(self, num_questions):
+        # reset the button colors and ask the next question
+        self.reset_button_colors()
+        self.ask_questions(num_questions)
 
 
     def reset_quiz(self):
-        # check if mixer has been initialized
-        if pygame.mixer.get_init() is None:
+        # check if a quiz has been started yet
+        if not self.quiz_started:
             self.region_combo.set("Select a Region")    # reset to default text
             self.num_answers_var.set(value=4)    # reset to default option
             self.num_questions_var.set(value=5) # reset to default option
+            self.hard_mode_var.set(False)   # reset to default option
+            self.weakest_first_var.set(False)   # reset to default option
+            self.speed_round_var.set(False) # reset to default option
             return
 
+        # cancel the next question, the countdown and every other pending quiz callback
+        self.scheduler.cancel_all()
+        self.wait_started = None    # the flag that was being waited for is not needed any more
+        self.answered = True    # no question is shown
+        self.timer_view.grid_forget()   # hide the countdown
+
         # stop music
         self.stop_music()
 
+        # cancel flags that are still being prefetched
+        self.prefetcher.cancel()
+
         # hide self.flag_label
-        self.flag_label.grid_forget()
+        self.flag_view.grid_forget()
 
         # reset values
-        self.score = 0  # set score to 0
-        self.current_question = 0   # set current question to 0
+        self.engine.reset() # set score and current question to 0
         self.region_combo.set("Select a Region")    # reset to default text
         self.num_answers_var.set(value=4)    # reset to default option
         self.num_questions_var.set(value=5) # reset to default option
-        self.score_label.grid(row=6, column=0, columnspan=5, pady=10)   # reposition score label
+        self.hard_mode_var.set(False)   # reset to default option
+        self.weakest_first_var.set(False)   # reset to default option
+        self.speed_round_var.set(False) # reset to default option
+        self.score_view.grid(row=6, column=0, columnspan=5, pady=10)   # reposition score label
         self.update_option_menu(30) # reset to default option menu
         self.hide_buttons() # hide all buttons
         self.update_score_board()   # update score board
 
 
     def reset_button_colors(self):
+        started = latency.begin()
+
         # reset all button colors
-        self.button1.configure(fg_color=("#3B8ED0","#1F6AA5"), text_color="white", hover_color="#093254")
-        self.button2.configure(fg_color=("#3B8ED0","#1F6AA5"), text_color="white", hover_color="#093254")
-        self.button3.configure(fg_color=("#3B8ED0","#1F6AA5"), text_color="white", hover_color="#093254")
-        self.button4.configure(fg_color=("#3B8ED0","#1F6AA5"), text_color="white", hover_color="#093254")
+        for button_view in self.button_views:
+            button_view.set(fg_color=("#3B8ED0","#1F6AA5"), text_color="white", hover_color="#093254")
+        latency.end("reset_button_colors", started)
 
 
     def enable_buttons(self):
+        started = latency.begin()
+
         # re-enable all buttons for normal function
-        self.button1.configure(state="normal")
-        self.button2.configure(state="normal")
-        self.button3.configure(state="normal")
-        self.button4.configure(state="normal")
+        for button_view in self.button_views:
+            button_view.set(state="normal")
+        latency.end("enable_buttons", started)
 
 
     def disable_buttons(self):
-        # disable all buttons to prevent spamming
-        self.button1.configure(state="disabled")
-        self.button2.configure(state="disabled")
-        self.button3.configure(state="disabled")
-        self.button4.configure(state="disabled")
+        started = latency.begin()
+
+        # disable all buttons to prevent spamming, applied now instead of with the next batch so Tk drops clicks that are still queued
+        for button_view in self.button_views:
+            button_view.set(state="disabled")
+        self.views.flush()
+        latency.end("disable_buttons", started)
 
 
     def start_music(self):
-        self.mixer = pygame.mixer.init() # initialize mixer
-        music_file = "songs/Jump Up, Super Star! Music Box Version.mp3"  # path to music file
-        pygame.mixer.music.load(music_file) # load mixer with music file
-        pygame.mixer.music.play(-1) # loop music file continuously
+        self.audio.play("quiz", loops=-1)   # loop music file continuously
 
 
     def stop_music(self):
-        pygame.mixer.music.stop()   # stop music
+        self.audio.stop()   # stop music
 
 
 if __name__ == "__main__":
+    # parse command line options
+    parser = argparse.ArgumentParser(description="Country Flags Game")
+    parser.add_argument("--serve", action="store_true", help="host quizzes for many players over HTTP instead of opening a window")
+    parser.add_argument("--host", default="127.0.0.1", help="address the server listens on (with --serve)")
+    parser.add_argument("--port", type=int, default=8765, help="port the server listens on (with --serve)")
+    parser.add_argument("--profile-startup", action="store_true", help="print import, catalog parse and first paint times")
+    parser.add_argument("--quality", choices=list(QUALITY_TIERS), default=DEFAULT_QUALITY, help="flag rendering quality (default: %(default)s)")
+    parser.add_argument("--player", help="name the statistics are saved under (default: your login name)")
+    parser.add_argument("--latency-log", metavar="PATH", help="record per-question latency and write histograms to PATH (.json or .csv)")
+    args = parser.parse_args()
+    imports_done = time.perf_counter()  # time when all modules have been imported
+
+    # run the multi-session server instead of the GUI
+    if args.serve:
+        import quiz_server  # imported here so the GUI does not load the server
+        quiz_server.serve(args.host, args.port)
+        sys.exit()
+
+    # enable latency recording if requested, and also write the histograms on exit
+    if args.latency_log:
+        latency.enable(args.latency_log)
+        atexit.register(latency.export)
+
     root = CTk()  # create main window
     ctk.set_appearance_mode("dark")
     ctk.set_default_color_theme("blue")
 
-    app = CountryFlagsGame(root) # create instance of CountryFlagsGame class
+    app = CountryFlagsGame(root, quality=args.quality, player=args.player) # create instance of CountryFlagsGame class
+
+    # report how long it took until the window was drawn and the country data was ready
+    if args.profile_startup:
+        root.update()   # draw the window now so the first paint can be timed
+        first_paint = time.perf_counter()
+        catalog_future = app.catalog_future
+        app.wait_for_catalog()  # wait for the background read to finish
+        interactive = time.perf_counter()
+
+        print("Startup profile:")
+        print(f"  imports:             {(imports_done - STARTUP_STARTED) * 1000:8.1f} ms")
+        print(f"  window + widgets:    {(first_paint - imports_done) * 1000:8.1f} ms")
+        print(f"  first paint:         {(first_paint - STARTUP_STARTED) * 1000:8.1f} ms after start")
+        if catalog_future is not None:
+            print(f"  catalog parse:       {catalog_future.load_seconds * 1000:8.1f} ms (background)")
+        print(f"  time to interactive: {(interactive - STARTUP_STARTED) * 1000:8.1f} ms after start")
+
     root.mainloop() # keeps window running and interactive
@@ -0,0 +1,102 @@
+import queue
+import threading
+
+# music files used by the game, keyed by track name
+TRACKS = {
+    "quiz": "songs/Jump Up, Super Star! Music Box Version.mp3",   # loops while a quiz is running
+    "congratulations": "songs/congratulations.mp3", # played when a quiz is completed
+}
+
+
+class AudioService:
+
+    # constructor, tracks maps a track name to the path of its music file
+    def __init__(self, tracks=TRACKS):
+        self.tracks = dict(tracks)  # music files to decode
+        self.commands = queue.Queue()   # play/stop/fadeout commands sent from the UI thread
+        self.sounds = {}    # maps a track name to its decoded pygame Sound (only touched on the audio thread)
+        self.channels = {}  # maps a track name to the pygame Channel it was last played on (only touched on the audio thread)
+        self.available = None   # None until the mixer was initialized, then True or False
+        self.thread = None  # audio thread, created by start
+
+
+    def start(self):
+        # start the audio thread, which initializes the mixer once and decodes all tracks before handling commands
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="audio", daemon=True)
+            self.thread.start()
+
+
+    def play(self, track, loops=0):
+        # play a track, loops=-1 repeats it forever
+        self.start()
+        self.commands.put(("play", track, loops))
+
+
+    def stop(self):
+        # stop all tracks
+        self.start()
+        self.commands.put(("stop",))
+
+
+    def fadeout(self, milliseconds):
+        # fade out all tracks over the given time and then stop them
+        self.start()
+        self.commands.put(("fadeout", milliseconds))
+
+
+    def shutdown(self):
+        # stop the audio thread after the commands that are already queued
+        if self.thread is not None:
+            self.commands.put(None)
+
+
+    def initialize(self):
+        # initialize the mixer and decode every track, runs on the audio thread
+        try:
+            import pygame   # imported here so pygame does not slow down startup
+            pygame.mixer.init() # initialize mixer
+        except Exception as e:
+            # no audio device (e.g. on a headless server), keep running without sound
+            print(f"Audio disabled: {e}")   # print error message
+            self.available = False
+            return
+
+        # decode the music files into memory so playing them never waits on disk I/O
+        for name, music_file in self.tracks.items():
+            try:
+                self.sounds[name] = pygame.mixer.Sound(music_file)
+            except Exception as e:
+                print(f"Error loading music file {music_file}: {e}")   # print error message
+        self.available = True
+
+
+    def run(self):
+        # handle commands until shutdown, runs on the audio thread
+        self.initialize()
+
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break   # shutdown was requested
+
+            # without a mixer every command is ignored
+            if not self.available:
+                continue
+
+            try:
+                import pygame
+                if command[0] == "play":
+                    sound = self.sounds.get(command[1])
+                    if sound is not None:
+                        # a track plays at most once, playing it again restarts it instead of adding a second copy
+                        channel = self.channels.get(command[1])
+                        if channel is not None and channel.get_sound() is sound:
+                            channel.stop()
+                        self.channels[command[1]] = sound.play(loops=command[2])
+                elif command[0] == "stop":
+                    pygame.mixer.stop() # stop all tracks
+                elif command[0] == "fadeout":
+                    pygame.mixer.fadeout(command[1])    # fade out all tracks
+            except Exception as e:
+                print(f"Audio error: {e}")  # print error message
@@ -0,0 +1,273 @@
+from CountryFlagsGame import find_flags, prepare_quiz, regions, select_quiz_countries
+from country_catalog import CountryCatalog
+from country_pools import PoolIndex, PRESET_POOLS
+from flag_bundle import FlagBundle, BUNDLE_FILE
+from flag_cache import FlagImageCache, QUALITY_TIERS, flag_cache
+from flag_manifest import FlagManifest
+from flag_prefetcher import FLAG_SIZE
+from player_stats import StatsStore
+from quiz_engine import QuizEngine
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# default file the results are compared against and saved to
+BASELINE_FILE = "benchmark_baseline.json"
+
+# default allowed slowdown before a benchmark counts as a regression (0.25 = 25% slower than the baseline)
+REGRESSION_THRESHOLD = 0.25
+
+# answer-count settings offered in the GUI
+ANSWER_COUNTS = [1, 2, 3, 4]
+
+# player whose made-up answers the weakest-first and "missed" benchmarks look up
+BENCH_PLAYER = "benchmark"
+
+# display and screen the virtual framebuffer is started with for the widget benchmarks
+XVFB_DISPLAY = ":99"
+XVFB_SCREEN = "1920x1080x24"
+
+
+def measure(function, repeat, number=1):
+    # call function number times, repeat times over, and return the median and minimum seconds per call
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start_time) / number)
+    return {"median": statistics.median(timings), "min": min(timings)}
+
+
+def bench_startup(results, repeat):
+    # time a cold import of the game module in a fresh interpreter (this is what the user waits for before the window)
+    command = [sys.executable, "-c", "import CountryFlagsGame"]
+    environment = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    results["startup/import"] = measure(lambda: subprocess.run(command, env=environment, check=True), max(3, repeat // 5))
+
+    # time reading and indexing AllCountries.json
+    results["startup/catalog"] = measure(lambda: CountryCatalog.from_file("AllCountries.json"), repeat, 10)
+
+    # time checking the flag manifest against the flag directory when nothing changed
+    FlagManifest.load()
+    results["startup/manifest"] = measure(FlagManifest.load, repeat, 10)
+
+
+def open_stats(catalog, directory):
+    # create a statistics store in directory with made-up answers for every country, so weakest-first has something to rank
+    stats = StatsStore(os.path.join(directory, "benchmark_stats.db"))
+    if stats.start():
+        rng = random.Random(0)
+        for _ in range(5):
+            for code in catalog.country_codes:
+                stats.record_answer(BENCH_PLAYER, "All Countries", code, rng.random() < 0.7, rng.uniform(500, 5000))
+        stats.flush()
+    return stats
+
+
+def bench_regions(results, catalog, manifest, stats, repeat):
+    # time the non-widget part of start_quiz through the same functions the game calls
+    engine = QuizEngine(catalog, random.Random(0))  # seeded so every run times the same quizzes
+    flag_codes = [code for code, flag_path in find_flags(catalog.country_codes, manifest)]
+    pools = PoolIndex(catalog, lambda: stats.missed_last_time(BENCH_PLAYER, catalog.country_codes), flag_codes)  # built the same way as wait_for_pools
+
+    for region_name in regions + PRESET_POOLS:
+        # time populating the countries of the region (or pool), and with the weakest countries first
+        num_questions = pools.count(region_name)
+        results[f"get_countries_by_region/{region_name}"] = measure(lambda: select_quiz_countries(engine, pools, stats, BENCH_PLAYER, region_name, num_questions, False), repeat, 100)
+        results[f"get_countries_by_region/{region_name}/weakest"] = measure(lambda: select_quiz_countries(engine, pools, stats, BENCH_PLAYER, region_name, num_questions, True), repeat, 10)
+        if region_name not in regions:
+            continue    # the rest is the same for a pool as for a region
+
+        # time looking up the flag files of the region
+        country_codes = engine.codes()
+        results[f"load_images/{region_name}"] = measure(lambda: find_flags(country_codes, manifest), repeat, 10)
+
+        for num_answers in ANSWER_COUNTS:
+            # time everything start_quiz does apart from widgets and music
+            results[f"start_quiz/{region_name}/{num_answers}"] = measure(lambda: prepare_quiz(engine, pools, stats, BENCH_PLAYER, manifest, region_name, num_answers, num_questions, False), repeat, 10)
+
+            # time building the answer choices of every country in the region
+            engine.start(num_answers)
+            country_ids = engine.country_ids
+            def ask_all():
+                engine.current_question = 0
+                for country in country_ids:
+                    engine.next_question(country)
+            results[f"ask_questions/{region_name}/{num_answers}"] = measure(ask_all, repeat, 10)
+
+
+def bench_flag_images(results, catalog, manifest, repeat):
+    # time the per-question image path of ask_questions for every flag in the region, without and with the cache
+    bundle = FlagBundle.open(BUNDLE_FILE, manifest)    # None unless flag_bundle.py was run
+    for region_name in regions:
+        flags = find_flags((code for code, _ in catalog.countries(region_name)), manifest)
+        number = max(1, repeat // 10)   # decoding is slow, use fewer rounds
+
+        for quality in QUALITY_TIERS:
+            def decode_cold():
+                cache = FlagImageCache()    # a new cache every round so every flag is decoded
+                for code, flag_path in flags:
+                    cache.load(code, flag_path, FLAG_SIZE, quality)
+            results[f"flag_image/{region_name}/cold/{quality}"] = measure(decode_cold, number)
+
+        warm_cache = FlagImageCache()
+        for code, flag_path in flags:
+            warm_cache.load(code, flag_path, FLAG_SIZE) # fill the cache once
+        def decode_warm():
+            for code, flag_path in flags:
+                warm_cache.load(code, flag_path, FLAG_SIZE)
+        results[f"flag_image/{region_name}/warm"] = measure(decode_warm, repeat, 10)
+
+        # time mapping the flags from the bundle instead of decoding them
+        if bundle is not None:
+            bundle_cache = FlagImageCache()
+            bundle_cache.bundle = bundle
+            def map_bundle():
+                for code, flag_path in flags:
+                    bundle_cache.load(code, flag_path, FLAG_SIZE)
+            results[f"flag_image/{region_name}/bundle"] = measure(map_bundle, repeat, 10)
+
+
+def start_xvfb(display=XVFB_DISPLAY):
+    # start a virtual framebuffer for the widget benchmarks if there is no display, returns the process (None if none was started)
+    if os.environ.get("DISPLAY"):
+        return None
+    try:
+        process = subprocess.Popen(["Xvfb", display, "-screen", "0", XVFB_SCREEN, "-nolisten", "tcp"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        print("Xvfb is not installed, the widget benchmarks need a display")
+        return None
+    os.environ["DISPLAY"] = display
+    time.sleep(1)   # give the server time to accept connections
+    return process
+
+
+def bench_widgets(results, catalog, manifest, repeat):
+    # time the widget part of ask_questions (CTkImage, configure and redraw) in the real game window, needs a display
+    import tkinter
+    import customtkinter as ctk
+    from CountryFlagsGame import CountryFlagsGame
+    try:
+        root = ctk.CTk()
+    except tkinter.TclError as e:
+        print(f"Skipping the widget benchmarks, no display ({e}), use --xvfb or run under xvfb-run")
+        return
+
+    with open("AllCountries.json", "r") as file:
+        app = CountryFlagsGame(root, data=json.load(file))
+    app.stats.available = False # keep the benchmark out of the player's statistics database
+    root.update()
+    app.engine.start(4)
+    app.start_new_challenge()   # show the answer buttons and the score board
+    for region_name in regions:
+        # decode the flags of the region beforehand, bench_flag_images times that
+        names = [name for code, name in catalog.countries(region_name)]
+        images = []
+        for index, (code, flag_path) in enumerate(find_flags((code for code, _ in catalog.countries(region_name)), manifest)):
+            option_list = [names[(index + offset) % len(names)] for offset in range(4)] # four answer choices
+            images.append((flag_cache.load(code, flag_path, app.flag_pixel_size, app.quality), option_list))
+
+        # show every flag of the region the way ask_questions does and wait until it is drawn
+        def show_all():
+            for pil_image, option_list in images:
+                app.show_question(pil_image, option_list)
+                app.views.flush()
+                root.update_idletasks()
+        results[f"show_question/{region_name}"] = measure(show_all, max(1, repeat // 5))
+    root.destroy()
+
+
+def run_benchmarks(repeat, include_images=True, include_widgets=True):
+    # run every benchmark and return a dictionary of name -> timings
+    catalog = CountryCatalog.from_file("AllCountries.json")
+    results = {}
+    bench_startup(results, repeat)
+    manifest = FlagManifest.load()
+    with tempfile.TemporaryDirectory() as directory:
+        stats = open_stats(catalog, directory)
+        bench_regions(results, catalog, manifest, stats, repeat)
+        stats.close()
+    if include_images:
+        bench_flag_images(results, catalog, manifest, repeat)
+    if include_widgets:
+        bench_widgets(results, catalog, manifest, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # return a list of (name, baseline seconds, current seconds) for every benchmark that got slower than the threshold allows
+    regressions = []
+    for name, timings in results.items():
+        if name not in baseline:
+            continue    # new benchmark, nothing to compare against
+        old = baseline[name]["median"]
+        new = timings["median"]
+        if new > old * (1 + threshold):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main(argv=None):
+    # command line entry point
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the Country Flags Game without a display.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON file to compare the results against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file instead of comparing")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="allowed slowdown as a fraction of the baseline (default: 0.25)")
+    parser.add_argument("--repeat", type=int, default=15, help="number of rounds per benchmark")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--no-images", action="store_true", help="skip the flag decoding benchmarks")
+    parser.add_argument("--no-widgets", action="store_true", help="skip the widget benchmarks (they need a display)")
+    parser.add_argument("--xvfb", action="store_true", help="start a virtual framebuffer for the widget benchmarks if there is no display")
+    args = parser.parse_args(argv)
+
+    # the game reads its data and flags relative to its own directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    xvfb = start_xvfb() if args.xvfb and not args.no_widgets else None
+    try:
+        results = run_benchmarks(args.repeat, not args.no_images, not args.no_widgets)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+    # print the results
+    for name, timings in results.items():
+        print(f"{name:<50} median {timings['median'] * 1e6:12.1f} us   min {timings['min'] * 1e6:12.1f} us")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline found at {args.baseline}, run with --save-baseline first")
+        return 0
+
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+
+    # fail if any benchmark got slower than the threshold allows
+    regressions = compare(results, baseline, args.threshold)
+    for name, old, new in regressions:
+        print(f"REGRESSION: {name} {old * 1e6:.1f} us -> {new * 1e6:.1f} us ({(new / old - 1) * 100:+.1f}%)")
+    if regressions:
+        return 1
+
+    print(f"No regressions above {args.threshold * 100:.0f}% compared to {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
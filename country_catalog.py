@@ -0,0 +1,104 @@
+from array import array
+from concurrent.futures import Future
+from types import MappingProxyType
+import json
+import sys
+import threading
+import time
+
+
+class CountryCatalog:
+
+    # only these attributes, so a catalog has no per-instance dictionary
+    __slots__ = ("country_codes", "country_names", "ids", "region_ids", "counts")
+
+    # constructor, data is the dictionary read from AllCountries.json (region -> list of {country_code, country_name})
+    def __init__(self, data):
+        codes = []  # country code of every country id
+        names = []  # country name of every country id
+        ids = {}    # maps a country code to its id
+        region_ids = {} # maps a region to an array of the ids of its countries
+
+        # give every country one small integer id, a country listed in several regions (e.g. "All Countries") keeps the same id
+        for region_name, countries in data.items():
+            region = array("H")  # 2 bytes per country instead of a list of dictionaries
+            for country in countries:
+                code = country["country_code"]
+                if code not in ids:
+                    ids[code] = len(codes)
+                    codes.append(sys.intern(code))  # interned so every copy of a code or name is the same object
+                    names.append(sys.intern(country["country_name"]))
+                region.append(ids[code])
+            region_ids[region_name] = region
+
+        # read-only views so the catalog can be shared without copying
+        self.country_codes = tuple(codes)
+        self.country_names = tuple(names)
+        self.ids = MappingProxyType(ids)
+        self.region_ids = MappingProxyType(region_ids)
+        self.counts = MappingProxyType({region_name: len(region) for region_name, region in region_ids.items()})  # precomputed number of countries per region
+
+
+    @classmethod
+    def from_file(cls, file_path):
+        # build the catalog from a JSON file
+        with open(file_path, "r") as file:
+            return cls(json.load(file))
+
+
+    def __contains__(self, region_name):
+        # check if a region is in the catalog
+        return region_name in self.counts
+
+
+    def regions(self):
+        # return the names of all regions in the catalog
+        return list(self.counts)
+
+
+    def count(self, region_name):
+        # return the number of countries in a region
+        return self.counts[region_name]
+
+
+    def __len__(self):
+        # return the number of different countries in the catalog
+        return len(self.country_codes)
+
+
+    def countries(self, region_name):
+        # return the (country code, country name) pairs of a region in file order
+        return [(self.country_codes[country], self.country_names[country]) for country in self.region_ids[region_name]]
+
+
+    def codes(self, country_ids):
+        # return the country codes of some country ids
+        return [self.country_codes[country] for country in country_ids]
+
+
+    def names(self, country_ids):
+        # return the country names of some country ids
+        return [self.country_names[country] for country in country_ids]
+
+
+def load_in_background(file_path):
+    # read the catalog on a separate thread and return a Future that will hold it
+    future = Future()
+
+    def load():
+        started = time.perf_counter()
+        try:
+            catalog = CountryCatalog.from_file(file_path)
+        except Exception as e:
+            catalog, error = None, e    # reported when the result is asked for
+        else:
+            error = None
+        future.load_seconds = time.perf_counter() - started  # how long reading and parsing took
+
+        if error is None:
+            future.set_result(catalog)
+        else:
+            future.set_exception(error)
+
+    threading.Thread(target=load, name="catalog-loader", daemon=True).start()
+    return future
@@ -0,0 +1,128 @@
+from array import array
+import re
+
+# pool of the countries the player got wrong the last time they were asked
+MISSED = "missed"
+
+# prefix of the pools of countries whose name starts with one of the given letters, e.g. "letter:S"
+LETTER_PREFIX = "letter:"
+
+# operators that combine pools, evaluated left to right (use parentheses to group)
+OPERATORS = {"+": "union", "|": "union", "&": "intersection", "-": "difference"}
+
+# splits a pool expression into parentheses, operators and names
+TOKEN_PATTERN = re.compile(r"\s*([()+|&-]|[^()+|&-]+)")
+
+# ready-made pools offered in the region combo box next to the regions
+PRESET_POOLS = ["Europe + Caribbean", "letter:S", "Missed Last Time"]
+
+
+class PoolError(ValueError):
+    # raised for pool expressions that cannot be evaluated
+    pass
+
+
+class PoolIndex:
+
+    # constructor, missed_source returns the codes of the countries missed last time (optional), pools only contain the countries in codes (default: all)
+    def __init__(self, catalog, missed_source=None, codes=None):
+        self.catalog = catalog  # country catalog the pools are built from
+        self.missed_source = missed_source  # looked up every time the "missed" pool is used, the answers change between quizzes
+
+        # one bitset per attribute value, bit i is set if the country with id i has that value
+        self.regions = {}   # maps a lowercase region name to the bitset of its countries
+        for region_name, region in catalog.region_ids.items():
+            self.regions[region_name.lower()] = self.bitset(region)
+        self.letters = {}   # maps an uppercase first letter to the bitset of the countries whose name starts with it
+        for country, name in enumerate(catalog.country_names):
+            letter = name[:1].upper()
+            self.letters[letter] = self.letters.get(letter, 0) | (1 << country)
+        self.all = (1 << len(catalog)) - 1  # bitset of every country
+        self.available = self.all if codes is None else self.bitset(catalog.ids[code] for code in codes if code in catalog.ids)    # bitset of the countries that can be asked (e.g. the ones with a flag image)
+
+
+    @staticmethod
+    def bitset(country_ids):
+        # return the bitset of some country ids
+        bits = 0
+        for country in country_ids:
+            bits |= 1 << country
+        return bits
+
+
+    @staticmethod
+    def ids(bits):
+        # return the country ids in a bitset, in ascending order
+        country_ids = array("H")
+        while bits:
+            lowest = bits & -bits   # lowest set bit
+            country_ids.append(lowest.bit_length() - 1)
+            bits ^= lowest
+        return country_ids
+
+
+    def term(self, name):
+        # return the bitset of a single pool name
+        key = name.strip().lower()
+        if key in self.regions:
+            return self.regions[key]
+        if key.startswith(LETTER_PREFIX) and key[len(LETTER_PREFIX):]:
+            bits = 0
+            for letter in key[len(LETTER_PREFIX):].upper():
+                bits |= self.letters.get(letter, 0)
+            return bits
+        if key in (MISSED, "missed last time"):
+            codes = self.missed_source() if self.missed_source is not None else []
+            return self.bitset(self.catalog.ids[code] for code in codes if code in self.catalog.ids)
+        raise PoolError(f"unknown pool: {name.strip()}")
+
+
+    def evaluate(self, expression):
+        # return the bitset of a pool expression such as "Europe + Caribbean", "letter:S" or "(Africa | Asia) - missed", without the countries that cannot be asked
+        tokens = [token.strip() for token in TOKEN_PATTERN.findall(expression) if token.strip()]
+        if not tokens:
+            raise PoolError("empty pool")
+        bits, position = self.parse(tokens, 0)
+        if position != len(tokens):
+            raise PoolError(f"unexpected {tokens[position]!r} in pool")
+        return bits & self.available
+
+
+    def parse(self, tokens, position):
+        # parse operand (operator operand)* starting at tokens[position], returns (bitset, position after it)
+        bits, position = self.operand(tokens, position)
+        while position < len(tokens) and tokens[position] in OPERATORS:
+            operator = OPERATORS[tokens[position]]
+            other, position = self.operand(tokens, position + 1)
+            if operator == "union":
+                bits |= other
+            elif operator == "intersection":
+                bits &= other
+            else:
+                bits &= ~other
+        return bits, position
+
+
+    def operand(self, tokens, position):
+        # parse a pool name or a parenthesized expression
+        if position >= len(tokens):
+            raise PoolError("pool ends with an operator")
+        token = tokens[position]
+        if token == "(":
+            bits, position = self.parse(tokens, position + 1)
+            if position >= len(tokens) or tokens[position] != ")":
+                raise PoolError("missing ) in pool")
+            return bits, position + 1
+        if token in OPERATORS or token == ")":
+            raise PoolError(f"unexpected {token!r} in pool")
+        return self.term(token), position + 1
+
+
+    def select(self, expression):
+        # return the country ids of a pool expression
+        return self.ids(self.evaluate(expression))
+
+
+    def count(self, expression):
+        # return the number of countries in a pool expression
+        return self.evaluate(expression).bit_count()
@@ -0,0 +1,178 @@
+from flag_cache import DEFAULT_QUALITY, QUALITY_TIERS, render_flag
+from flag_manifest import FlagManifest
+from flag_prefetcher import FLAG_SIZE, flag_display_size
+from PIL import Image
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+# file the pre-scaled flags are packed into
+BUNDLE_FILE = "flags.bundle"
+
+# bump when the layout of the bundle changes, older bundles are ignored
+BUNDLE_VERSION = 3
+
+# file header: magic, version, offset and length of the JSON index (which is written after the images)
+MAGIC = b"FLAGBNDL"
+HEADER = struct.Struct("<8sIQQ")
+
+# every image starts at a multiple of this many bytes
+ALIGNMENT = 64
+
+# image modes PIL can map straight from a buffer without copying, anything else (e.g. RGB, which most flags are) is stored as RGBA
+# render_flag converts palette images, so P never has to be stored
+MAPPED_MODES = ("L", "RGBA")
+
+
+def entry_key(code, size, quality):
+    # key of one pre-scaled flag in the index, e.g. "fr/650x420/balanced"
+    return f"{code.lower()}/{size[0]}x{size[1]}/{quality}"
+
+
+def compile_flag(task):
+    # render one flag at one size and quality, returns (key, index entry without offset, pixel bytes), runs in a worker process
+    code, flag_path, size, quality, compress = task
+    pil_image = render_flag(flag_path, size, quality)
+    if pil_image.mode not in MAPPED_MODES:
+        pil_image = pil_image.convert("RGBA")   # same pixels with an opaque alpha channel, PIL keeps RGB at four bytes per pixel anyway
+
+    entry = {"mode": pil_image.mode, "size": list(pil_image.size), "compressed": compress}
+
+    data = pil_image.tobytes()
+    if compress:
+        data = zlib.compress(data, 1)   # light compression, the images then have to be copied out of the bundle
+    return entry_key(code, size, quality), entry, data
+
+
+def build_bundle(manifest, sizes, qualities=(DEFAULT_QUALITY,), bundle_path=BUNDLE_FILE, workers=None, compress=False):
+    # render every flag in the manifest at every size and quality on a process pool and pack them into one file
+    from concurrent.futures import ProcessPoolExecutor  # imported here, the game only maps bundles and does not need multiprocessing
+    started = time.perf_counter()
+    tasks = [(code, entry["path"], tuple(size), quality, compress) for code, entry in sorted(manifest.flags.items()) for size in sizes for quality in qualities]
+    index = {"version": BUNDLE_VERSION, "hashes": {code: entry["sha256"] for code, entry in manifest.flags.items()}, "entries": {}}
+
+    # write to a temporary file so a running game never sees a half-written bundle
+    temp_path = bundle_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, BUNDLE_VERSION, 0, 0))    # filled in once the index is written
+
+        with ProcessPoolExecutor(workers) as executor:
+            for key, entry, data in executor.map(compile_flag, tasks, chunksize=8):
+                file.write(b"\0" * (-file.tell() % ALIGNMENT))
+                entry["offset"] = file.tell()
+                entry["length"] = len(data)
+                index["entries"][key] = entry
+                file.write(data)
+
+        # the index goes last, its offset and length go into the header
+        index_offset = file.tell()
+        index_data = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        file.write(index_data)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, BUNDLE_VERSION, index_offset, len(index_data)))
+    os.replace(temp_path, bundle_path)
+
+    return {"flags": len(manifest.flags), "images": len(tasks), "bytes": os.path.getsize(bundle_path), "seconds": time.perf_counter() - started}
+
+
+class FlagBundle:
+
+    # constructor, use open to create a bundle from a file
+    def __init__(self, path, buffer, entries):
+        self.path = path    # bundle file
+        self.buffer = buffer    # the whole file, memory-mapped
+        self.view = memoryview(buffer)  # slices of it do not copy
+        self.entries = entries  # maps an entry key to its index entry, only for flags that did not change since the bundle was built
+        self.hits = 0   # number of flags taken from the bundle
+        self.misses = 0 # number of flags that were not in the bundle (or out of date)
+
+
+    @classmethod
+    def open(cls, bundle_path, manifest):
+        # map a bundle and keep the flags whose image is unchanged, returns None if there is no usable bundle
+        try:
+            with open(bundle_path, "rb") as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)  # the mapping stays valid after the file is closed
+        except (OSError, ValueError):
+            return None # no bundle (or an empty file), the PNGs are used
+
+        try:
+            magic, version, index_offset, index_length = HEADER.unpack_from(buffer)
+            if magic != MAGIC or version != BUNDLE_VERSION:
+                raise ValueError("not a flag bundle of this version")
+            index = json.loads(bytes(buffer[index_offset:index_offset + index_length]))
+        except (struct.error, ValueError) as e:
+            print(f"ERROR: Ignoring flag bundle {bundle_path}: {e}")   # print error message
+            buffer.close()
+            return None
+
+        # only use images whose PNG is unchanged, the rest are read from the PNGs
+        hashes = index["hashes"]
+        fresh = {code for code, entry in manifest.flags.items() if hashes.get(code) == entry["sha256"]}
+        entries = {key: entry for key, entry in index["entries"].items() if key.split("/", 1)[0] in fresh and entry["offset"] + entry["length"] <= len(buffer)}
+        stale = sum(1 for code, entry in manifest.flags.items() if code in hashes and hashes[code] != entry["sha256"])   # flags that were never packed are not out of date
+        if stale:
+            print(f"Flag bundle {bundle_path} is out of date for {stale} flags, they are read from the PNGs (run flag_bundle.py to rebuild it)")
+        return cls(bundle_path, buffer, entries)
+
+
+    def image(self, code, size, quality=DEFAULT_QUALITY):
+        # return the pre-scaled flag as a PIL image backed by the mapped file, or None if the bundle does not have it
+        entry = self.entries.get(entry_key(code, size, quality))
+        if entry is None:
+            self.misses += 1
+            return None
+
+        data = self.view[entry["offset"]:entry["offset"] + entry["length"]]
+        if entry["compressed"]:
+            data = zlib.decompress(data)
+        pil_image = Image.frombuffer(entry["mode"], tuple(entry["size"]), data, "raw", entry["mode"], 0, 1)    # no copy, the image uses the mapped bytes
+        self.hits += 1
+        return pil_image
+
+
+    def stats(self):
+        # return the counters as a dictionary
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def parse_size(text):
+    # parse "WIDTHxHEIGHT" into a (width, height) tuple
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    # command line entry point for building the bundle
+    parser = argparse.ArgumentParser(description="Pack pre-scaled flag images into one memory-mapped bundle.")
+    parser.add_argument("--size", type=parse_size, action="append", help="flag size in pixels, e.g. 650x420 (can be repeated)")
+    parser.add_argument("--screen", action="append", help="screen the game runs on as WIDTHxHEIGHT or WIDTHxHEIGHT@SCALING, adds the flag size the game uses there (can be repeated)")
+    parser.add_argument("--quality", choices=list(QUALITY_TIERS), action="append", help=f"quality tier (can be repeated, default: {DEFAULT_QUALITY})")
+    parser.add_argument("--compress", action="store_true", help="compress the images lightly (smaller file, but images are copied out of it)")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--output", default=BUNDLE_FILE, help="bundle file to write (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    # collect the sizes, default to the size the game uses on a full HD screen
+    sizes = list(args.size or [])
+    for screen in args.screen or []:
+        resolution, _, scaling = screen.partition("@")
+        width, height = parse_size(resolution)
+        sizes.append(flag_display_size(width, height, float(scaling or 1.0))[1])
+    sizes = list(dict.fromkeys(sizes or [FLAG_SIZE]))  # without duplicates
+
+    manifest = FlagManifest.load()
+    manifest.report_bad()
+    result = build_bundle(manifest, sizes, args.quality or [DEFAULT_QUALITY], args.output, args.workers, args.compress)
+
+    # print the results
+    print(f"Packed {result['images']} images of {result['flags']} flags ({', '.join(f'{w}x{h}' for w, h in sizes)}) into {args.output}")
+    print(f"  {result['bytes'] / 1024 / 1024:.1f} MB in {result['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
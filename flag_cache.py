@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from latency_probe import latency
+from PIL import Image   # already loaded by customtkinter, deferring it saves nothing
+import threading
+
+# default number of bytes of decoded flag images kept in memory
+FLAG_CACHE_BUDGET = 128 * 1024 * 1024
+
+# resampling filter and reducing gap for each quality tier
+# a reducing gap lets PIL shrink large images with a fast box reduction before the final resampling pass
+QUALITY_TIERS = {
+    "fast": ("BILINEAR", 1.0),
+    "balanced": ("BICUBIC", 2.0),
+    "best": ("LANCZOS", None),
+}
+
+# quality tier used when none is selected
+DEFAULT_QUALITY = "balanced"
+
+
+def image_size_in_bytes(pil_image):
+    # estimate how much memory the pixel data of an image takes up
+    width, height = pil_image.size
+    return width * height * len(pil_image.getbands())
+
+
+def render_flag(flag_path, size, quality=DEFAULT_QUALITY):
+    # decode a flag image and resize it to size (width, height) in pixels using the given quality tier
+    resample_name, reducing_gap = QUALITY_TIERS[quality]
+
+    pil_image = Image.open(flag_path)   # load flag image into PIL Image object
+    pil_image.draft(None, size) # let formats that support it (e.g. JPEG) decode at a reduced size, does nothing for PNG
+
+    # palette images (most of the flags) are always resized with NEAREST by PIL, convert them so the tier's filter and reducing gap are used
+    # (to RGB unless they have transparency, three channels resize faster than four)
+    if pil_image.mode in ("1", "P"):
+        pil_image = pil_image.convert("RGBA" if "transparency" in pil_image.info else "RGB")
+
+    return pil_image.resize(size, getattr(Image.Resampling, resample_name), reducing_gap=reducing_gap)
+
+
+class FlagImageCache:
+
+    # constructor
+    def __init__(self, budget=FLAG_CACHE_BUDGET):
+        self.budget = budget    # maximum number of bytes of images kept in the cache
+        self.entries = OrderedDict()    # maps (country code, size, quality) to (image, bytes), least recently used first
+        self.current_bytes = 0  # number of bytes of images currently in the cache
+        self.hits = 0   # number of lookups that found the image in the cache
+        self.misses = 0 # number of lookups that had to decode the image
+        self.evictions = 0  # number of images removed to stay under the budget
+        self.lock = threading.Lock()    # the cache is shared between the UI thread and the prefetch workers
+        self.bundle = None  # packed, memory-mapped flags (see flag_bundle.py) tried before decoding a PNG
+
+
+    def get(self, code, size, quality=DEFAULT_QUALITY):
+        # return the cached image for (code, size, quality), or None if it is not cached
+        key = (code.lower(), tuple(size), quality)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)   # mark as most recently used
+            self.hits += 1
+            return entry[0]
+
+
+    def put(self, code, size, pil_image, quality=DEFAULT_QUALITY):
+        # add an image to the cache and evict the least recently used images until it fits the budget
+        key = (code.lower(), tuple(size), quality)
+        num_bytes = image_size_in_bytes(pil_image)
+
+        # images larger than the whole budget are never cached
+        if num_bytes > self.budget:
+            return
+
+        with self.lock:
+            # replace an existing entry for the same key
+            old_entry = self.entries.pop(key, None)
+            if old_entry is not None:
+                self.current_bytes -= old_entry[1]
+
+            self.entries[key] = (pil_image, num_bytes)
+            self.current_bytes += num_bytes
+
+            # evict least recently used images
+            while self.current_bytes > self.budget:
+                _, (_, evicted_bytes) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+
+
+    def load(self, code, flag_path, size, quality=DEFAULT_QUALITY):
+        # return the flag image resized to size, from the bundle if it has it, else decoding it only if it is not cached
+        if self.bundle is not None:
+            # pre-scaled flags are mapped from the bundle without decoding or copying, they take no memory so they are not cached
+            started = latency.begin()
+            pil_image = self.bundle.image(code, size, quality)
+            if pil_image is not None:
+                latency.end("bundle_map", started)
+                return pil_image
+
+        pil_image = self.get(code, size, quality)
+        if pil_image is None:
+            started = latency.begin()
+            pil_image = render_flag(flag_path, size, quality)
+            latency.end("decode_resize", started)
+            self.put(code, size, pil_image, quality)
+        return pil_image
+
+
+    def clear(self):
+        # remove all images from the cache (counters are kept)
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+
+    def stats(self):
+        # return the cache counters as a dictionary
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "budget": self.budget,
+            }
+
+
+# process-wide cache shared by every quiz
+flag_cache = FlagImageCache()
@@ -0,0 +1,136 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+
+# file the feature vectors are cached in between runs
+FEATURES_FILE = "flag_features.npz"
+
+# size (width, height) of the thumbnail used for the colour histogram
+HISTOGRAM_SIZE = (32, 20)
+
+# size (width, height) of the coarse grid that captures the layout (stripes, crosses, ...)
+LAYOUT_SIZE = (8, 5)
+
+# number of levels per colour channel in the histogram (4 -> 4 * 4 * 4 = 64 bins)
+HISTOGRAM_LEVELS = 4
+
+# how much the layout and the colours count when comparing flags
+LAYOUT_WEIGHT = 1.0
+COLOR_WEIGHT = 1.0
+
+
+def flag_thumbnail(flag_path):
+    # decode a flag into a small RGB thumbnail (transparent parts become white), returns a uint8 array of shape (height, width, 3)
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(flag_path) as pil_image:
+        pil_image = pil_image.convert("RGBA")
+        background = Image.new("RGBA", pil_image.size, "white")
+        pil_image = Image.alpha_composite(background, pil_image).convert("RGB")
+        return np.asarray(pil_image.resize(HISTOGRAM_SIZE, Image.Resampling.BOX))
+
+
+def compute_features(thumbnails):
+    # turn a (flags, height, width, 3) uint8 array of thumbnails into one float32 feature vector per flag
+    import numpy as np
+
+    count = thumbnails.shape[0]
+    pixels = thumbnails.astype(np.float32) / 255
+
+    # layout: average colour of each cell of a coarse grid
+    cell_height = HISTOGRAM_SIZE[1] // LAYOUT_SIZE[1]
+    cell_width = HISTOGRAM_SIZE[0] // LAYOUT_SIZE[0]
+    layout = pixels.reshape(count, LAYOUT_SIZE[1], cell_height, LAYOUT_SIZE[0], cell_width, 3).mean(axis=(2, 4)).reshape(count, -1)
+
+    # colours: histogram of the quantized pixels of every flag, counted in one bincount over all flags
+    levels = (thumbnails.astype(np.int64) * HISTOGRAM_LEVELS) // 256
+    bins = (levels[..., 0] * HISTOGRAM_LEVELS + levels[..., 1]) * HISTOGRAM_LEVELS + levels[..., 2]
+    num_bins = HISTOGRAM_LEVELS ** 3
+    offsets = (np.arange(count) * num_bins)[:, None]
+    histogram = np.bincount((bins.reshape(count, -1) + offsets).ravel(), minlength=count * num_bins).reshape(count, num_bins)
+    histogram = np.sqrt(histogram / histogram.sum(axis=1, keepdims=True))   # square root so large areas do not drown out small details
+
+    # scale both parts to unit length so the weights decide how much each counts
+    layout /= np.linalg.norm(layout, axis=1, keepdims=True) + 1e-9
+    histogram /= np.linalg.norm(histogram, axis=1, keepdims=True) + 1e-9
+    return np.hstack([layout * LAYOUT_WEIGHT, histogram * COLOR_WEIGHT]).astype(np.float32)
+
+
+class FlagFeatures:
+
+    # constructor, codes[i] is the lowercase country code of features[i]
+    def __init__(self, codes, features):
+        import numpy as np
+
+        self.codes = list(codes)    # country codes in the order of the feature vectors
+        self.index = {code: index for index, code in enumerate(self.codes)}   # maps a country code to its row
+        self.features = features    # (flags, dimensions) float32 array
+
+        # squared distance between every pair of flags, computed once so a query is only a row lookup
+        squared = np.sum(features * features, axis=1)
+        self.distances = squared[:, None] + squared[None, :] - 2 * (features @ features.T)
+        np.fill_diagonal(self.distances, np.inf)    # a flag is never a distractor for itself
+
+
+    @classmethod
+    def load(cls, manifest, cache_path=FEATURES_FILE):
+        # load the cached feature vectors, recomputing them if any flag in the manifest changed
+        import numpy as np
+
+        codes = sorted(manifest.flags)
+        hashes = [manifest.flags[code]["sha256"] for code in codes]
+
+        # use the cache if it was built from exactly these images
+        if os.path.exists(cache_path):
+            try:
+                with np.load(cache_path) as data:
+                    if list(data["codes"]) == codes and list(data["hashes"]) == hashes:
+                        return cls(codes, data["features"])
+            except Exception as e:
+                print(f"Error reading flag features {cache_path}: {e}")  # print error message
+
+        # compute the feature vectors of all flags and cache them (PIL releases the GIL while decoding, so threads help)
+        with ThreadPoolExecutor(thread_name_prefix="flag-features") as executor:
+            thumbnails = np.stack(list(executor.map(flag_thumbnail, [manifest.flags[code]["path"] for code in codes])))
+        features = compute_features(thumbnails)
+        try:
+            np.savez_compressed(cache_path, codes=np.array(codes), hashes=np.array(hashes), features=features)
+        except OSError as e:
+            print(f"ERROR: Could not save flag features {cache_path}: {e}")    # print error message
+        return cls(codes, features)
+
+
+    def indexes(self, codes):
+        # return the rows of the given country codes as an array, codes without features are skipped
+        import numpy as np
+        return np.array([self.index[code.lower()] for code in codes if code.lower() in self.index], dtype=np.intp)
+
+
+    def nearest(self, code, candidates, k):
+        # return the positions in candidates (an array from indexes) of the k flags that look most like the flag of code, most similar first
+        import numpy as np
+
+        row = self.index.get(code.lower())
+        count = min(k + 1, len(candidates))  # one extra in case the flag itself is a candidate (it has an infinite distance)
+        if row is None or k <= 0 or count == 0:
+            return []
+
+        distances = self.distances[row, candidates]
+        nearest = np.argpartition(distances, count - 1)[:count] # smallest distances, unordered
+        nearest = nearest[np.argsort(distances[nearest])]   # order them from most to least similar
+        return [int(index) for index in nearest if candidates[index] != row][:k]
+
+
+def load_in_background(manifest, cache_path=FEATURES_FILE):
+    # load the feature vectors on a separate thread and return a Future that will hold them
+    future = Future()
+
+    def load():
+        try:
+            future.set_result(FlagFeatures.load(manifest, cache_path))
+        except Exception as e:
+            future.set_exception(e) # reported when the result is asked for
+
+    threading.Thread(target=load, name="flag-features", daemon=True).start()
+    return future
@@ -0,0 +1,152 @@
+from concurrent.futures import Future
+import hashlib
+import io
+import json
+import os
+import threading
+
+# directory containing flag images
+FLAG_DIR = "flags"
+
+# file the manifest is saved to between runs
+MANIFEST_FILE = "flag_manifest.json"
+
+# bump when the format of the manifest file changes, older files are rebuilt
+MANIFEST_VERSION = 1
+
+
+def inspect_flag(flag_path):
+    # read a flag image, return (sha256 hex digest, width, height), raises an exception if the image is corrupt
+    from PIL import Image   # imported here so PIL is only loaded when a flag has changed
+
+    with open(flag_path, "rb") as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+
+    # check that the image can be decoded
+    with Image.open(io.BytesIO(content)) as pil_image:
+        width, height = pil_image.size
+        pil_image.verify()  # checks the PNG chunks and checksums
+    with Image.open(io.BytesIO(content)) as pil_image:
+        pil_image.load()    # verify does not decode the pixels, so decode them too
+    return digest, width, height
+
+
+class FlagManifest:
+
+    # constructor
+    def __init__(self, flag_dir=FLAG_DIR, manifest_path=MANIFEST_FILE):
+        self.flag_dir = flag_dir    # directory containing the flag images
+        self.manifest_path = manifest_path  # file the manifest is saved to
+        self.flags = {} # maps a lowercase country code to {path, size, mtime_ns, width, height, sha256}
+        self.bad = {}   # maps a filename to {size, mtime_ns, error} for images that could not be read
+        self.checked = 0    # number of images that were (re)inspected by the last refresh
+
+
+    @classmethod
+    def load(cls, flag_dir=FLAG_DIR, manifest_path=MANIFEST_FILE):
+        # read the saved manifest and bring it up to date with the flag directory
+        manifest = cls(flag_dir, manifest_path)
+        manifest.read()
+        if manifest.refresh():
+            manifest.save() # only write the file when something changed
+        return manifest
+
+
+    def read(self):
+        # read the saved manifest, a missing or outdated file just means every image is inspected again
+        try:
+            with open(self.manifest_path, "r") as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return
+
+        if data.get("version") == MANIFEST_VERSION and data.get("flag_dir") == self.flag_dir:
+            self.flags = data.get("flags", {})
+            self.bad = data.get("bad", {})
+
+
+    def save(self):
+        # write the manifest so the next start only has to inspect changed images
+        data = {"version": MANIFEST_VERSION, "flag_dir": self.flag_dir, "flags": self.flags, "bad": self.bad}
+        try:
+            with open(self.manifest_path, "w") as file:
+                json.dump(data, file, indent=1, sort_keys=True)
+        except OSError as e:
+            print(f"ERROR: Could not save flag manifest {self.manifest_path}: {e}")    # print error message
+
+
+    def refresh(self):
+        # inspect images that are new or whose size or modification time changed, return True if anything changed
+        flags = {}
+        bad = {}
+        changed = False
+        self.checked = 0
+
+        for entry in os.scandir(self.flag_dir):
+            if not entry.name.lower().endswith(".png") or not entry.is_file():
+                continue
+
+            code = entry.name[:-4].lower()
+            stat = entry.stat()
+            old = self.flags.get(code) or self.bad.get(entry.name)
+
+            # unchanged image, keep what is known about it
+            if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                if code in self.flags:
+                    flags[code] = old
+                else:
+                    bad[entry.name] = old
+                continue
+
+            # new or changed image, inspect it
+            changed = True
+            self.checked += 1
+            flag_path = os.path.join(self.flag_dir, entry.name)
+            try:
+                digest, width, height = inspect_flag(flag_path)
+                flags[code] = {"path": flag_path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "width": width, "height": height, "sha256": digest}
+            except Exception as e:
+                bad[entry.name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "error": str(e)}
+
+        # images that were removed also count as a change
+        if flags.keys() != self.flags.keys() or bad.keys() != self.bad.keys():
+            changed = True
+
+        self.flags = flags
+        self.bad = bad
+        return changed
+
+
+    def path(self, code):
+        # return the path to the flag image of a country code, or None if there is no valid image
+        entry = self.flags.get(code.lower())
+        return entry["path"] if entry is not None else None
+
+
+    def __contains__(self, code):
+        # check if a country code has a valid flag image
+        return code.lower() in self.flags
+
+
+    def report_bad(self):
+        # print every flag image that could not be read
+        for filename, entry in sorted(self.bad.items()):
+            print(f"ERROR: Bad flag image {os.path.join(self.flag_dir, filename)}: {entry['error']}")   # print error message
+
+
+def load_in_background(flag_dir=FLAG_DIR, manifest_path=MANIFEST_FILE):
+    # load (and if needed rebuild) the manifest on a separate thread and return a Future that will hold it
+    future = Future()
+
+    def load():
+        try:
+            manifest = FlagManifest.load(flag_dir, manifest_path)
+        except Exception as e:
+            future.set_exception(e) # reported when the result is asked for
+        else:
+            manifest.report_bad()   # report bad images up front instead of when they are shown
+            future.set_result(manifest)
+
+    threading.Thread(target=load, name="flag-manifest", daemon=True).start()
+    return future
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from flag_cache import flag_cache, DEFAULT_QUALITY
+import queue
+
+# default number of flags decoded ahead of the current question
+PREFETCH_DEPTH = 3
+
+# default number of worker threads used to decode flags
+PREFETCH_WORKERS = 2
+
+# size (width, height) that flag images are displayed at, in CTk's unscaled units
+FLAG_SIZE = (650, 420)
+
+# screen size (width, height) in unscaled units that FLAG_SIZE was designed for
+REFERENCE_SCREEN = (1920, 1080)
+
+
+def flag_display_size(screen_width, screen_height, scaling=1.0):
+    # return the flag size in CTk units and in real pixels for a screen (in pixels) and a DPI scaling factor
+    # flags keep FLAG_SIZE on screens at least as large as REFERENCE_SCREEN and shrink on smaller ones
+    factor = min(1.0, screen_width / (REFERENCE_SCREEN[0] * scaling), screen_height / (REFERENCE_SCREEN[1] * scaling))
+    size = (round(FLAG_SIZE[0] * factor), round(FLAG_SIZE[1] * factor))
+    pixel_size = (round(size[0] * scaling), round(size[1] * scaling))   # CTk draws the image at size * scaling pixels
+    return size, pixel_size
+
+
+def decode_flag(code, flag_path, size=FLAG_SIZE, quality=DEFAULT_QUALITY):
+    # load the flag image and resize it, this is the slow part that should stay off the Tk thread
+    return flag_cache.load(code, flag_path, size, quality)
+
+
+class FlagPrefetcher:
+
+    # constructor
+    def __init__(self, depth=PREFETCH_DEPTH, workers=PREFETCH_WORKERS, size=FLAG_SIZE, quality=DEFAULT_QUALITY):
+        self.depth = max(1, depth)  # number of flags to keep decoded ahead of the current question
+        self.size = size    # size (in pixels) the flags are resized to
+        self.quality = quality  # quality tier used to resize the flags
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flag-prefetch")   # worker pool that decodes the flags
+        self.results = queue.Queue()    # finished images handed back to the UI thread
+        self.generation = 0 # bumped on every cancel so late results from old quizzes are dropped
+        self.flags = [] # list of tuples that store the country code and path to the flag image
+        self.next_index = 0 # index of the next flag to submit to the worker pool
+        self.pending = {}   # maps a flag index to its future while it is being decoded
+        self.ready = {} # maps a flag index to its decoded PIL image (only touched on the UI thread)
+        self.failed = set() # indexes of flags that could not be decoded
+
+
+    def start(self, flags):
+        # drop any work left over from a previous quiz
+        self.cancel()
+
+        # remember the flags of the new quiz and start decoding the first ones
+        self.flags = list(flags)
+        self.advance(0)
+
+
+    def advance(self, current_index):
+        # keep the worker pool self.depth flags ahead of current_index
+        while self.next_index < len(self.flags) and self.next_index < current_index + self.depth:
+            code, flag_path = self.flags[self.next_index]   # get country code and path to the flag image
+            self.pending[self.next_index] = self.executor.submit(self.decode, self.generation, self.next_index, code, flag_path)
+            self.next_index += 1
+
+
+    def decode(self, generation, index, code, flag_path):
+        # runs on a worker thread, skip the work if the quiz was reset in the meantime
+        if generation != self.generation:
+            return
+
+        try:
+            pil_image = decode_flag(code, flag_path, self.size, self.quality) # decode and resize the flag (or take it from the cache)
+        except Exception as e:
+            # exception is thrown, let the UI thread fall back to decoding it itself
+            print(f"Error prefetching image {flag_path}: {e}")  # print error message
+            pil_image = None
+
+        # hand the finished image back to the UI thread
+        self.results.put((generation, index, pil_image))
+
+
+    def drain(self):
+        # move all finished images from the queue into self.ready, must be called on the UI thread
+        while True:
+            try:
+                generation, index, pil_image = self.results.get_nowait()
+            except queue.Empty:
+                break   # no more finished images
+
+            # ignore results that belong to a cancelled quiz
+            if generation != self.generation:
+                continue
+
+            self.pending.pop(index, None)   # flag is no longer being decoded
+            if pil_image is None:
+                self.failed.add(index)  # decoding failed
+            else:
+                self.ready[index] = pil_image   # decoding succeeded
+
+
+    def get(self, index):
+        # return the decoded image for the flag at index, or None if it is not ready (yet)
+        self.drain()
+        self.advance(index + 1) # queue up the flags after this one
+        return self.ready.pop(index, None)
+
+
+    def is_pending(self, index):
+        # check if the flag at index is still being decoded by the worker pool
+        if index in self.ready or index in self.failed:
+            return False
+        return index in self.pending or self.next_index <= index < len(self.flags)
+
+
+    def cancel(self):
+        # invalidate all work that is still queued or running
+        self.generation += 1
+
+        # cancel futures that have not started yet
+        for future in self.pending.values():
+            future.cancel()
+
+        # reset values
+        self.flags = []
+        self.next_index = 0
+        self.pending = {}
+        self.ready = {}
+        self.failed = set()
+
+        # discard results that were already handed back
+        self.drain()
+
+
+    def shutdown(self):
+        # cancel pending work and stop the worker pool
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,129 @@
+import csv
+import json
+import math
+import threading
+import time
+
+# upper bounds (in milliseconds) of the histogram buckets, the last bucket catches everything slower
+HISTOGRAM_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+def percentile(sorted_values, fraction):
+    # return the value at the given fraction (0-1) of a sorted list using the nearest-rank method
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values) - 1e-9))   # 1-based nearest rank, the tolerance keeps e.g. 0.07 * 100 = 7.000000000000001 at 7
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LatencyRecorder:
+
+    # constructor, the recorder does nothing until enable is called
+    def __init__(self):
+        self.enabled = False    # recording is opt-in
+        self.output_path = None # file the histograms are written to (.json or .csv)
+        self.samples = {}   # maps a phase name to a list of durations in seconds
+        self.counter_sources = {}   # maps a name to a function returning a dictionary of counters to include in the report
+        self.lock = threading.Lock()    # phases are also recorded from the prefetch workers
+
+
+    def enable(self, output_path):
+        # start recording and write the results to output_path on export
+        self.enabled = True
+        self.output_path = output_path
+
+
+    def add_counters(self, name, source):
+        # include the counters returned by source() in every report
+        self.counter_sources[name] = source
+
+
+    def counters(self):
+        # collect the current value of every counter as (name, value) pairs
+        counters = []
+        for name, source in self.counter_sources.items():
+            for key, value in source().items():
+                counters.append((f"{name}.{key}", value))
+        return counters
+
+
+    def begin(self):
+        # return a start time for a phase, or None when recording is disabled
+        if not self.enabled:
+            return None
+        return time.perf_counter()
+
+
+    def end(self, phase, started):
+        # record the time since started for a phase
+        if started is None:
+            return
+        self.record(phase, time.perf_counter() - started)
+
+
+    def record(self, phase, duration):
+        # record a duration (in seconds) that was measured elsewhere
+        if not self.enabled:
+            return
+        with self.lock:
+            self.samples.setdefault(phase, []).append(duration)
+
+
+    def summary(self):
+        # return count, mean, p50, p95, p99 and max (in milliseconds) plus a histogram for every phase
+        with self.lock:
+            samples = {phase: sorted(durations) for phase, durations in self.samples.items()}
+
+        summary = {}
+        for phase, durations in samples.items():
+            durations_ms = [duration * 1000 for duration in durations]
+
+            # count how many durations fall in each bucket
+            histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            bucket = 0
+            for duration in durations_ms:
+                while bucket < len(HISTOGRAM_BUCKETS_MS) and duration > HISTOGRAM_BUCKETS_MS[bucket]:
+                    bucket += 1 # durations are sorted, so the bucket only moves forward
+                histogram[bucket] += 1
+
+            summary[phase] = {
+                "count": len(durations_ms),
+                "mean_ms": sum(durations_ms) / len(durations_ms),
+                "p50_ms": percentile(durations_ms, 0.50),
+                "p95_ms": percentile(durations_ms, 0.95),
+                "p99_ms": percentile(durations_ms, 0.99),
+                "max_ms": durations_ms[-1],
+                "histogram": {f"<={bound}ms": count for bound, count in zip(HISTOGRAM_BUCKETS_MS, histogram)} | {f">{HISTOGRAM_BUCKETS_MS[-1]}ms": histogram[-1]},
+            }
+        return summary
+
+
+    def export(self, output_path=None):
+        # write the summary to a JSON or CSV file (chosen by the file extension)
+        output_path = output_path or self.output_path
+        if not self.enabled or not output_path:
+            return
+
+        summary = self.summary()
+        try:
+            if output_path.lower().endswith(".csv"):
+                # one row per phase, histogram buckets as extra columns
+                bucket_names = [f"<={bound}ms" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+                with open(output_path, "w", newline="") as file:
+                    writer = csv.writer(file)
+                    writer.writerow(["phase", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"] + bucket_names)
+                    for phase, stats in summary.items():
+                        writer.writerow([phase, stats["count"], f"{stats['mean_ms']:.3f}", f"{stats['p50_ms']:.3f}", f"{stats['p95_ms']:.3f}", f"{stats['p99_ms']:.3f}", f"{stats['max_ms']:.3f}"] + [stats["histogram"][name] for name in bucket_names])
+
+                    # counters are written as extra rows with only a count
+                    for name, value in self.counters():
+                        writer.writerow([f"counter:{name}", value])
+            else:
+                with open(output_path, "w") as file:
+                    json.dump({"phases": summary, "counters": dict(self.counters())}, file, indent=2)
+        except OSError as e:
+            print(f"ERROR: Could not write latency report to {output_path}: {e}")  # print error message
+
+
+# process-wide recorder, disabled unless the game is started with --latency-log
+latency = LatencyRecorder()
@@ -0,0 +1,115 @@
+from country_catalog import CountryCatalog
+from quiz_engine import QuizEngine
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+
+def rss_bytes():
+    # return the resident set size of this process in bytes, or None if it cannot be read on this platform
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")    # Linux: current size
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource # not available on Windows
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024    # peak size, bytes on macOS and kilobytes elsewhere
+    except (ImportError, OSError):
+        return None
+
+
+def traced(function):
+    # call function and return (result, bytes it still holds afterwards, peak bytes while it ran) as seen by tracemalloc
+    gc.collect()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function()
+    gc.collect()
+    after, peak = tracemalloc.get_traced_memory()
+    return result, after - before, peak - before
+
+
+def play_session(catalog, region_name, num_answers, num_questions, seed):
+    # play one quiz and keep everything a session holds: the engine and the questions it asked
+    engine = QuizEngine(catalog, random.Random(seed))
+    engine.select_countries(region_name)
+    engine.start(num_answers)
+    questions = [engine.next_question(country) for country in engine.country_ids[:num_questions]]
+    return engine, questions
+
+
+def memory_report(data_file, region_name, num_sessions, num_answers, num_questions):
+    # measure the memory used by the country data and by num_sessions quiz sessions
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    rss_start = rss_bytes()
+
+    # the country data as it is read from the file, for comparison
+    def read_raw():
+        with open(data_file, "r") as file:
+            return json.load(file)
+    raw, raw_bytes, _ = traced(read_raw)
+
+    # the catalog the game keeps instead
+    catalog, catalog_bytes, catalog_peak = traced(lambda: CountryCatalog(raw))
+    del raw
+    gc.collect()
+    rss_catalog = rss_bytes()
+
+    # many sessions side by side, as on a server
+    sessions, sessions_bytes, _ = traced(lambda: [play_session(catalog, region_name, num_answers, num_questions, seed) for seed in range(num_sessions)])
+    rss_sessions = rss_bytes()
+
+    if not tracing:
+        tracemalloc.stop()
+    return {
+        "countries": len(catalog),
+        "raw_json_bytes": raw_bytes,
+        "catalog_bytes": catalog_bytes,
+        "catalog_peak_bytes": catalog_peak,
+        "sessions": num_sessions,
+        "questions_per_session": len(sessions[0][1]) if sessions else 0,
+        "session_bytes": sessions_bytes / num_sessions if num_sessions else 0.0,
+        "rss_start_bytes": rss_start,
+        "rss_catalog_bytes": rss_catalog,
+        "rss_sessions_bytes": rss_sessions,
+    }
+
+
+def main(argv=None):
+    # command line entry point for the memory report
+    parser = argparse.ArgumentParser(description="Report the memory used by the country catalog and by quiz sessions.")
+    parser.add_argument("--data", default="AllCountries.json", help="path to the country data file")
+    parser.add_argument("--region", default="All Countries", help="region the sessions are played in")
+    parser.add_argument("--sessions", type=int, default=1000, help="number of sessions to keep side by side")
+    parser.add_argument("--answers", type=int, default=4, choices=[1, 2, 3, 4], help="number of answer choices")
+    parser.add_argument("--questions", type=int, default=30, help="number of questions per session")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = memory_report(args.data, args.region, args.sessions, args.answers, args.questions)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    def megabytes(value):
+        return "n/a" if value is None else f"{value / 1024 / 1024:.1f} MB"
+
+    # print the results
+    print(f"Catalog ({report['countries']} countries):")
+    print(f"  as read from JSON:   {report['raw_json_bytes'] / 1024:8.1f} KB")
+    print(f"  CountryCatalog:      {report['catalog_bytes'] / 1024:8.1f} KB (peak while building {report['catalog_peak_bytes'] / 1024:.1f} KB)")
+    print(f"Session ({report['questions_per_session']} questions, {args.answers} answer choices, {args.region}):")
+    print(f"  per session:         {report['session_bytes'] / 1024:8.1f} KB ({report['sessions']} sessions)")
+    print(f"Resident set size: {megabytes(report['rss_start_bytes'])} at start, {megabytes(report['rss_catalog_bytes'])} with the catalog, {megabytes(report['rss_sessions_bytes'])} with the sessions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import getpass
+import queue
+import threading
+import time
+
+# database file the statistics are kept in between runs
+STATS_FILE = "player_stats.db"
+
+# the writer commits at most this often (in seconds) and at most this many records at once
+BATCH_SECONDS = 0.5
+BATCH_SIZE = 500
+
+# compaction keeps this many of the most recent answers, older ones only live on in the per-country totals
+KEEP_ANSWERS = 20000
+
+# queued by flush, the writer commits its batch as soon as it sees it instead of waiting for BATCH_SECONDS
+FLUSH = ("flush", None)
+
+# the writer compacts the file after this many answers were written since the last compaction
+COMPACT_EVERY = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    player TEXT NOT NULL,
+    played_at REAL NOT NULL,
+    region TEXT NOT NULL,
+    code TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    response_ms REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quizzes (
+    id INTEGER PRIMARY KEY,
+    player TEXT NOT NULL,
+    played_at REAL NOT NULL,
+    region TEXT NOT NULL,
+    num_questions INTEGER NOT NULL,
+    num_answers INTEGER NOT NULL,
+    score INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS country_stats (
+    player TEXT NOT NULL,
+    code TEXT NOT NULL,
+    asked INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    last_correct INTEGER NOT NULL,
+    last_played REAL NOT NULL,
+    PRIMARY KEY (player, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS quizzes_player ON quizzes (player, played_at);
+"""
+
+# adds one answer to the per-country totals of a player
+UPSERT_COUNTRY = """
+INSERT INTO country_stats (player, code, asked, correct, total_ms, last_correct, last_played) VALUES (?, ?, 1, ?, ?, ?, ?)
+ON CONFLICT (player, code) DO UPDATE SET
+    asked = asked + 1,
+    correct = correct + excluded.correct,
+    total_ms = total_ms + excluded.total_ms,
+    last_correct = excluded.last_correct,
+    last_played = excluded.last_played
+"""
+
+
+def default_player():
+    # name of the player when none is given, the login name of the user
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "player"
+
+
+class StatsStore:
+
+    # constructor, nothing is opened until start is called
+    def __init__(self, path=STATS_FILE):
+        self.path = path    # SQLite database file
+        self.records = queue.Queue()    # answers and quizzes waiting to be written, sent from the UI thread
+        self.connection = None  # connection used for queries on the calling thread
+        self.lock = threading.Lock()    # queries may come from more than one thread
+        self.available = None   # None until the database was opened, then True or False
+        self.thread = None  # writer thread, created by start
+        self.written = 0    # number of answers written so far
+        self.batches = 0    # number of commits made by the writer
+        self.compactions = 0    # number of times the file was compacted
+
+
+    def open(self):
+        # open a connection to the database, creating the tables on first use
+        import sqlite3  # imported here so sqlite3 does not slow down startup, the store is opened once the window is up
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")  # only takes effect when the file is created, lets compaction return free pages
+        connection.execute("PRAGMA journal_mode = WAL") # queries do not wait for the writer
+        connection.execute("PRAGMA synchronous = NORMAL")   # a commit does not wait for the disk, only a checkpoint does
+        connection.executescript(SCHEMA)
+        return connection
+
+
+    def start(self):
+        # open the database and start the writer thread, statistics are disabled if the file cannot be opened
+        if self.available is not None:
+            return self.available
+        import sqlite3
+        try:
+            self.connection = self.open()
+            writer = self.open()
+        except sqlite3.Error as e:
+            print(f"Player statistics disabled: {e}")   # print error message
+            self.available = False
+            return False
+
+        self.available = True
+        self.thread = threading.Thread(target=self.run, args=(writer,), name="player-stats", daemon=True)
+        self.thread.start()
+        return True
+
+
+    def record_answer(self, player, region, code, correct, response_ms):
+        # queue one answered question, returns immediately
+        if self.available:
+            self.records.put(("answer", (player, time.time(), region, code, int(correct), response_ms)))
+
+
+    def record_quiz(self, player, region, num_questions, num_answers, score):
+        # queue one completed quiz, returns immediately
+        if self.available:
+            self.records.put(("quiz", (player, time.time(), region, num_questions, num_answers, score)))
+
+
+    def flush(self):
+        # wait until everything queued so far has been written, the writer ends its batch window early
+        if self.available:
+            self.records.put(FLUSH)
+            self.records.join()
+
+
+    def close(self):
+        # write what is still queued and stop the writer thread
+        if self.available:
+            self.records.put(None)
+            self.thread.join()
+            with self.lock:
+                self.connection.close()
+            self.available = False
+
+
+    def run(self, connection):
+        # write queued records in batches until close, runs on the writer thread
+        import sqlite3
+        since_compaction = 0
+        running = True
+        while running:
+            # wait for the first record, then collect whatever else arrives within BATCH_SECONDS (or until a flush is requested)
+            batch = [self.records.get()]
+            deadline = time.monotonic() + BATCH_SECONDS
+            while batch[-1] is not None and batch[-1] is not FLUSH and len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.records.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                running = False # close was requested, write the rest and stop
+
+            answers = [values for kind, values in filter(None, batch) if kind == "answer"]
+            quizzes = [values for kind, values in filter(None, batch) if kind == "quiz"]
+            if not answers and not quizzes:
+                for _ in batch:
+                    self.records.task_done()    # nothing to write (e.g. a flush with nothing queued)
+                continue
+            try:
+                with connection:    # one transaction (and one commit) per batch
+                    connection.executemany("INSERT INTO answers (player, played_at, region, code, correct, response_ms) VALUES (?, ?, ?, ?, ?, ?)", answers)
+                    connection.executemany(UPSERT_COUNTRY, [(player, code, correct, response_ms, correct, played_at) for player, played_at, region, code, correct, response_ms in answers])
+                    connection.executemany("INSERT INTO quizzes (player, played_at, region, num_questions, num_answers, score) VALUES (?, ?, ?, ?, ?, ?)", quizzes)
+                self.written += len(answers)
+                self.batches += 1
+                since_compaction += len(answers)
+                if since_compaction >= COMPACT_EVERY:
+                    self.compact(connection)
+                    since_compaction = 0
+            except sqlite3.Error as e:
+                print(f"Error writing player statistics: {e}")  # print error message
+            finally:
+                for _ in batch:
+                    self.records.task_done()
+        connection.close()
+
+
+    def compact(self, connection=None):
+        # drop all but the most recent answers (their totals are kept in country_stats) and give the free space back
+        connection = connection or self.connection
+        with self.lock:
+            with connection:
+                connection.execute("DELETE FROM answers WHERE id <= (SELECT MAX(id) FROM answers) - ?", (KEEP_ANSWERS,))
+            connection.executescript("PRAGMA incremental_vacuum")    # executescript steps the pragma to the end, execute only frees one page
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")   # shrink the write-ahead log as well
+        self.compactions += 1
+
+
+    def weakest(self, player, codes, limit):
+        # return up to limit of the given country codes the player got wrong most often, weakest first
+        if not self.available or not codes or limit <= 0:
+            return []
+        self.flush()    # include the answers of the quiz that just ended
+
+        # rank by the share of correct answers with one extra right and wrong answer, so one lucky guess does not count as mastered
+        placeholders = ",".join("?" * len(codes))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT code FROM country_stats WHERE player = ? AND code IN ({placeholders}) AND correct < asked "
+                "ORDER BY (correct + 1.0) / (asked + 2), last_played DESC LIMIT ?", (player, *codes, limit)).fetchall()
+        return [row[0] for row in rows]
+
+
+    def missed_last_time(self, player, codes):
+        # return the given country codes whose most recent answer by the player was wrong
+        if not self.available or not codes:
+            return []
+        self.flush()
+        placeholders = ",".join("?" * len(codes))
+        with self.lock:
+            rows = self.connection.execute(f"SELECT code FROM country_stats WHERE player = ? AND code IN ({placeholders}) AND last_correct = 0", (player, *codes)).fetchall()
+        return [row[0] for row in rows]
+
+
+    def summary(self, player):
+        # return the number of quizzes, answers, correct answers and the mean response time of a player
+        self.flush()
+        with self.lock:
+            quizzes = self.connection.execute("SELECT COUNT(*) FROM quizzes WHERE player = ?", (player,)).fetchone()[0]
+            asked, correct, total_ms = self.connection.execute("SELECT TOTAL(asked), TOTAL(correct), TOTAL(total_ms) FROM country_stats WHERE player = ?", (player,)).fetchone()
+        return {"quizzes": quizzes, "answers": int(asked), "correct": int(correct), "mean_response_ms": total_ms / asked if asked else 0.0}
+
+
+    def stats(self):
+        # return the writer counters as a dictionary
+        return {"written": self.written, "batches": self.batches, "compactions": self.compactions, "queued": self.records.qsize()}
+
+
+def main(argv=None):
+    # command line entry point to look at (or compact) the statistics of a player
+    parser = argparse.ArgumentParser(description="Show Country Flags Game player statistics.")
+    parser.add_argument("--player", default=default_player(), help="player to show (default: %(default)s)")
+    parser.add_argument("--region", default="All Countries", help="region to list the weakest countries of")
+    parser.add_argument("--limit", type=int, default=10, help="number of weakest countries to list")
+    parser.add_argument("--data", default="AllCountries.json", help="path to the country data file")
+    parser.add_argument("--stats", default=STATS_FILE, help="path to the statistics database")
+    parser.add_argument("--compact", action="store_true", help="compact the database file")
+    args = parser.parse_args(argv)
+
+    from country_catalog import CountryCatalog
+    catalog = CountryCatalog.from_file(args.data)
+    store = StatsStore(args.stats)
+    if not store.start():
+        return
+    if args.compact:
+        store.compact()
+
+    summary = store.summary(args.player)
+    print(f"{args.player}: {summary['quizzes']} quizzes, {summary['correct']}/{summary['answers']} correct, {summary['mean_response_ms']:.0f} ms per answer")
+    names = dict(catalog.countries(args.region))
+    started = time.perf_counter()
+    weakest = store.weakest(args.player, list(names), args.limit)
+    print(f"Weakest in {args.region} ({(time.perf_counter() - started) * 1000:.2f} ms):")
+    for code in weakest:
+        print(f"  {code}  {names[code]}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+from array import array
+from collections import namedtuple
+from country_catalog import CountryCatalog
+import argparse
+import random
+import time
+
+# in hard mode the wrong answers are drawn from the flags that are most similar to the correct one,
+# out of this many times the number of wrong answers needed (so the same flag does not always get the same choices)
+HARD_MODE_POOL = 2
+
+# a single quiz question: the country id of the flag, a tuple of the country ids of the answer choices and the index of the correct one
+Question = namedtuple("Question", ["country", "options", "correct_answer"])
+
+
+def generate_series(max_value):
+    # handle cases where max_value is less than 10
+    if max_value < 10:
+        return [str(max_value)] # return a list with 1 option: max_value
+
+    # handle cases where max_value is between 10 and 20 (exclusive)
+    if max_value < 20:
+        return [str(5), str(10), str(max_value)]    # return a list with 3 options: 5, 10, and max_value
+
+    # base series for values greater than or equal to 20
+    base_series = [5, 10, 20, 30]  # list of base options
+
+    # handle case where max_value is less than or equal to the last element in base_series
+    if max_value <= base_series[-1]:
+        # create a series with values from base_series that are less than max_value
+        series = [x for x in base_series if x < max_value]
+
+        # append max_value to the series
+        series.append(max_value)
+    else:
+        # extend the base series to include max_value
+        series = base_series + [max_value]
+
+    # ensure the series contains no more than five elements
+    while len(series) > 5:
+        series.pop(0)   # discard the first element in the series
+
+    return [str(num) for num in series] # return the series as strings
+
+
+class QuizEngine:
+
+    # only these attributes, so the many engines of a server stay small
+    __slots__ = ("catalog", "rng", "score", "current_question", "num_answers", "country_ids", "positions", "correct_answer", "features", "candidates", "candidate_ids")
+
+    # constructor
+    def __init__(self, catalog, rng=None):
+        self.catalog = catalog  # country catalog the questions are drawn from
+        self.rng = rng if rng is not None else random.Random()  # random number generator, seed it for reproducible quizzes
+        self.score = 0  # user score
+        self.current_question = 0   # current question number
+        self.num_answers = 4    # default number of answer choices
+        self.country_ids = array("H")   # ids of the countries of the quiz in the order they are asked
+        self.positions = array("h")  # maps a country id to its position in self.country_ids (-1 if it is not in the quiz)
+        self.correct_answer = None # stores the correct answer
+        self.features = None    # flag feature vectors (see flag_features.py), set to turn on hard mode
+        self.candidates = None  # rows in self.features of the countries in self.country_ids that have a flag
+        self.candidate_ids = array("H") # country ids of self.candidates (same order)
+
+
+    def start(self, num_answers):
+        # set initial values for a new quiz, call select_countries first
+        self.current_question = 0   # set current question to 0
+        self.score = 0  # set score to 0
+        self.num_answers = num_answers  # set number of answer choices
+        self.correct_answer = None
+
+
+    def reset(self):
+        # reset values
+        self.score = 0  # set score to 0
+        self.current_question = 0   # set current question to 0
+
+
+    def select_countries(self, region_name, first=()):
+        # check if selected region is in the catalog, an unknown region gives a quiz without countries
+        region = self.catalog.region_ids[region_name] if region_name in self.catalog else array("H")
+        return self.select_pool(region, first)
+
+
+    def select_pool(self, country_ids, first=()):
+        # put the given country ids (a region or a custom pool, see country_pools.py) in random order for the quiz
+        # the whole pool is shuffled, not just the countries that are asked: pick_options draws the wrong answers from all of it by position
+        self.country_ids = array("H", country_ids)  # copy, the pool may be shared (e.g. a region of the catalog)
+        self.rng.shuffle(self.country_ids)
+
+        # ask the countries in first (country codes, e.g. the ones the player is weakest at) before the others
+        if first:
+            first = {self.catalog.ids[code] for code in first if code in self.catalog.ids}
+            self.country_ids = array("H", [country for country in self.country_ids if country in first] + [country for country in self.country_ids if country not in first])
+
+        # index the positions so distractors can be drawn without copying the countries
+        self.positions = array("h", [-1]) * len(self.catalog)
+        for position, country in enumerate(self.country_ids):
+            self.positions[country] = position
+
+        # in hard mode, look up the flags of the quiz once so every question only compares against them
+        if self.features is not None:
+            self.candidate_ids = array("H", [country for country in self.country_ids if self.catalog.country_codes[country].lower() in self.features.index])
+            self.candidates = self.features.indexes(self.catalog.codes(self.candidate_ids))
+        return self.country_ids
+
+
+    def codes(self):
+        # return the country codes of the quiz in the order they are asked
+        return self.catalog.codes(self.country_ids)
+
+
+    def pick_options(self, country):
+        # get the id of the correct country and num_answers-1 other answer choices without duplicates
+        correct_index = self.positions[country] # position of the correct country in self.country_ids
+        num_others = min(self.num_answers - 1, len(self.country_ids) - 1)   # number of wrong answer choices available
+
+        # hard mode: pick the wrong answers from the flags in the region that look most like this one
+        if self.features is not None and num_others > 0:
+            similar = self.features.nearest(self.catalog.country_codes[country], self.candidates, HARD_MODE_POOL * num_others)
+            if len(similar) >= num_others:
+                return [country] + [self.candidate_ids[index] for index in self.rng.sample(similar, num_others)]
+
+        # sample from all countries except the correct one by skipping over its index
+        option_list = [country]
+        for index in self.rng.sample(range(len(self.country_ids) - 1), num_others):
+            option_list.append(self.country_ids[index + 1 if index >= correct_index else index])
+        return option_list
+
+
+    def shuffle_options(self, option_list):
+        # shuffle the answer choices and determine the correct answer
+        correct_country = option_list[0]    # the correct country is always added first
+        self.rng.shuffle(option_list)   # shuffle the answer choices
+        self.correct_answer = option_list.index(correct_country)    # get index of correct answer
+        return self.correct_answer
+
+
+    def next_question(self, country):
+        # update question number
+        self.current_question += 1
+
+        # build the answer choices for the flag with the given country id
+        option_list = self.pick_options(country)
+        self.shuffle_options(option_list)
+        return Question(country, tuple(option_list), self.correct_answer)
+
+
+    def answer(self, selected_option):
+        # check if the selected answer choice is correct and update the score
+        if selected_option == self.correct_answer:
+            self.score += 1 # add to score
+            return True
+        return False
+
+
+    def percentage(self, num_questions):
+        # calculate score as a percentage of num_questions
+        return (self.score / num_questions) * 100
+
+
+def simulate(catalog, num_questions, seed=0, regions=None, answer_counts=(1, 2, 3, 4), features=None):
+    # run quizzes without a GUI until num_questions questions have been answered, and time each stage (pass features for hard mode)
+    rng = random.Random(seed)   # one seeded generator drives the whole run, so results are reproducible
+    engine = QuizEngine(catalog, rng)
+    engine.features = features
+    regions = list(regions) if regions else catalog.regions()
+    stage_times = {"select_countries": 0.0, "pick_options": 0.0, "shuffle_options": 0.0, "answer": 0.0}  # total seconds per stage
+    clock = time.perf_counter
+    questions = 0   # number of questions asked so far
+    quizzes = 0 # number of quizzes started so far
+    correct = 0 # number of questions answered correctly
+
+    start_time = clock()
+    while questions < num_questions:
+        # start a quiz with a random region, number of answer choices and number of questions
+        region_name = rng.choice(regions)
+        num_answers = rng.choice(answer_counts)
+        quiz_length = int(rng.choice(generate_series(catalog.count(region_name))))
+
+        t0 = clock()
+        engine.select_countries(region_name)
+        engine.start(num_answers)
+        stage_times["select_countries"] += clock() - t0
+        quizzes += 1
+
+        # ask the questions of the quiz and answer them randomly
+        for country in engine.country_ids[:min(quiz_length, num_questions - questions)]:
+            engine.current_question += 1
+
+            t0 = clock()
+            option_list = engine.pick_options(country)
+            t1 = clock()
+            engine.shuffle_options(option_list)
+            t2 = clock()
+            correct += engine.answer(rng.randrange(len(option_list)))
+            t3 = clock()
+
+            stage_times["pick_options"] += t1 - t0
+            stage_times["shuffle_options"] += t2 - t1
+            stage_times["answer"] += t3 - t2
+            questions += 1
+    elapsed = clock() - start_time
+
+    return {
+        "seed": seed,
+        "questions": questions,
+        "quizzes": quizzes,
+        "correct": correct,
+        "elapsed_seconds": elapsed,
+        "questions_per_second": questions / elapsed if elapsed else 0.0,
+        "stage_ns_per_question": {stage: total * 1e9 / questions for stage, total in stage_times.items()},
+    }
+
+
+def main(argv=None):
+    # command line entry point for the batch simulation
+    parser = argparse.ArgumentParser(description="Simulate Country Flags Game quizzes without a GUI.")
+    parser.add_argument("--questions", type=int, default=1000000, help="number of questions to simulate")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random number generator")
+    parser.add_argument("--region", action="append", help="region to draw quizzes from (can be repeated, default: all)")
+    parser.add_argument("--answers", type=int, action="append", choices=[1, 2, 3, 4], help="number of answer choices (can be repeated, default: all)")
+    parser.add_argument("--data", default="AllCountries.json", help="path to the country data file")
+    parser.add_argument("--hard", action="store_true", help="use similar-looking flags as wrong answers (needs numpy)")
+    args = parser.parse_args(argv)
+
+    catalog = CountryCatalog.from_file(args.data)
+    features = None
+    if args.hard:
+        from flag_features import FlagFeatures
+        from flag_manifest import FlagManifest
+        features = FlagFeatures.load(FlagManifest.load())
+    result = simulate(catalog, args.questions, args.seed, args.region, tuple(args.answers or (1, 2, 3, 4)), features)
+
+    # print the results
+    print(f"Simulated {result['questions']} questions in {result['quizzes']} quizzes in {result['elapsed_seconds']:.2f}s")
+    print(f"Throughput: {result['questions_per_second']:.0f} questions/sec (correct: {result['correct']})")
+    for stage, ns in result["stage_ns_per_question"].items():
+        print(f"  {stage:<17} {ns:10.0f} ns/question")
+
+
+if __name__ == "__main__":
+    main()
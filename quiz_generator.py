@@ -0,0 +1,169 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from country_catalog import CountryCatalog
+from country_pools import PoolIndex
+from flag_manifest import FlagManifest
+from quiz_engine import QuizEngine, generate_series
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+
+# questions generated per task, every chunk has its own seed so the output does not depend on the number of workers
+CHUNK_QUESTIONS = 10000
+
+# chunks that may be generated ahead of the one being written, per worker (limits memory use)
+CHUNKS_IN_FLIGHT = 2
+
+# columns of the CSV output (answer choices that are not used are left empty)
+CSV_COLUMNS = ["question", "quiz", "region", "code", "option1", "option2", "option3", "option4", "answer"]
+
+# catalog, regions without the countries that have no flag image and options of the run, set once in every worker process
+worker_state = {}
+
+
+def init_worker(data_file, flag_codes, options):
+    # load the catalog once per process instead of once per chunk
+    catalog = CountryCatalog.from_file(data_file)
+    worker_state["catalog"] = catalog
+    worker_state["pools"] = PoolIndex(catalog, codes=[code for code in catalog.country_codes if code.lower() in flag_codes])  # masked the same way as wait_for_pools
+    worker_state["options"] = options
+
+
+def generate_chunk(chunk):
+    # generate the questions of one chunk and return them formatted as JSONL or CSV text
+    catalog = worker_state["catalog"]
+    pools = worker_state["pools"]
+    options = worker_state["options"]
+
+    rng = random.Random(f"{options['seed']}/{chunk}")   # the same chunk always gets the same questions
+    engine = QuizEngine(catalog, rng)
+    first = chunk * CHUNK_QUESTIONS # number of the first question of the chunk
+    count = min(CHUNK_QUESTIONS, options["questions"] - first)
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n") if options["format"] == "csv" else None
+    number = first
+    quiz = 0
+    while number < first + count:
+        # start a quiz the way start_quiz does: pick the countries of the region that have a flag, wrong answers are drawn from them too
+        region_name = rng.choice(options["regions"])
+        num_answers = rng.choice(options["answers"])
+        engine.select_pool(pools.select(region_name))
+        engine.start(num_answers)
+        countries = engine.country_ids
+        quiz_length = options["quiz_length"] or int(rng.choice(generate_series(len(countries))))
+        quiz += 1
+
+        # ask the questions the way ask_questions does
+        for country in countries[:min(quiz_length, first + count - number)]:
+            question = engine.next_question(country)
+            number += 1
+            names = catalog.names(question.options)
+            if writer is None:
+                output.write(json.dumps({"question": number, "quiz": f"{chunk + 1}.{quiz}", "region": region_name, "code": catalog.country_codes[country], "options": names, "answer": question.correct_answer}, ensure_ascii=False))
+                output.write("\n")
+            else:
+                writer.writerow([number, f"{chunk + 1}.{quiz}", region_name, catalog.country_codes[country]] + names + [""] * (4 - len(names)) + [question.correct_answer])
+    return output.getvalue()
+
+
+def generate(output, questions, seed=0, regions=None, answers=(1, 2, 3, 4), quiz_length=None, output_format="jsonl", workers=None, data_file="AllCountries.json", progress=None):
+    # write questions questions to the text file output, spread over workers processes, and return the statistics of the run
+    catalog = CountryCatalog.from_file(data_file)
+    regions = list(regions) if regions else catalog.regions()
+    for region_name in regions:
+        if region_name not in catalog:
+            raise ValueError(f"unknown region: {region_name}")
+    flag_codes = frozenset(FlagManifest.load().flags)   # only countries with a valid flag are asked, as in load_images
+    for region_name in regions:
+        if not any(code.lower() in flag_codes for code in catalog.codes(catalog.region_ids[region_name])):
+            raise ValueError(f"no flags for region: {region_name}")
+    options = {"seed": seed, "questions": questions, "regions": regions, "answers": list(answers), "quiz_length": quiz_length, "format": output_format}
+    workers = workers or os.cpu_count() or 1
+    num_chunks = (questions + CHUNK_QUESTIONS - 1) // CHUNK_QUESTIONS
+
+    written = 0 # number of characters written (about the number of bytes)
+    started = time.perf_counter()
+    if output_format == "csv":
+        output.write(",".join(CSV_COLUMNS) + "\n")
+
+    if workers == 1:
+        # no pool needed, generate the chunks in this process
+        init_worker(data_file, flag_codes, options)
+        for chunk in range(num_chunks):
+            text = generate_chunk(chunk)
+            output.write(text)
+            written += len(text)
+            if progress:
+                progress(min((chunk + 1) * CHUNK_QUESTIONS, questions), time.perf_counter() - started)
+    else:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(data_file, flag_codes, options)) as executor:
+            # keep a few chunks in flight and write them in order as they finish
+            pending = deque()
+            next_chunk = 0
+            while pending or next_chunk < num_chunks:
+                while next_chunk < num_chunks and len(pending) < workers * CHUNKS_IN_FLIGHT:
+                    pending.append(executor.submit(generate_chunk, next_chunk))
+                    next_chunk += 1
+                text = pending.popleft().result()
+                output.write(text)
+                written += len(text)
+                if progress:
+                    progress(min((next_chunk - len(pending)) * CHUNK_QUESTIONS, questions), time.perf_counter() - started)
+
+    output.flush()
+    elapsed = time.perf_counter() - started
+    return {
+        "questions": questions,
+        "workers": workers,
+        "chunks": num_chunks,
+        "elapsed_seconds": elapsed,
+        "questions_per_second": questions / elapsed if elapsed else 0.0,
+        "megabytes_per_second": written / elapsed / 1024 / 1024 if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    # command line entry point for generating quiz sets
+    parser = argparse.ArgumentParser(description="Generate Country Flags Game quizzes for worksheets and offline play.")
+    parser.add_argument("--questions", type=int, default=1000000, help="number of questions to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed, the same seed always gives the same output")
+    parser.add_argument("--region", action="append", help="region to draw quizzes from (can be repeated, default: all)")
+    parser.add_argument("--answers", type=int, action="append", choices=[1, 2, 3, 4], help="number of answer choices (can be repeated, default: all)")
+    parser.add_argument("--quiz-length", type=int, help="questions per quiz (default: one of the choices the game offers for the region)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="output format (default: from the output file name, else jsonl)")
+    parser.add_argument("--output", default="-", help="file to write to (default: standard output)")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--data", default="AllCountries.json", help="path to the country data file")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    if args.questions < 0 or (args.quiz_length is not None and args.quiz_length < 1):
+        parser.error("--questions and --quiz-length must be positive")
+
+    # report progress on standard error so it does not mix with the questions
+    def progress(done, elapsed):
+        print(f"\r{done}/{args.questions} questions, {done / elapsed if elapsed else 0:.0f} questions/sec", end="", file=sys.stderr, flush=True)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        result = generate(output, args.questions, args.seed, args.region, tuple(args.answers or (1, 2, 3, 4)), args.quiz_length, output_format, args.workers, args.data, progress)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    # print the results
+    print(file=sys.stderr)
+    print(f"Generated {result['questions']} questions in {result['elapsed_seconds']:.2f}s with {result['workers']} worker(s)", file=sys.stderr)
+    print(f"Throughput: {result['questions_per_second']:.0f} questions/sec, {result['megabytes_per_second']:.1f} MB/sec", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from latency_probe import latency
+import math
+import time
+
+
+class QuizScheduler:
+
+    # constructor, root is the Tk window whose event loop runs the callbacks
+    def __init__(self, root, clock=time.monotonic):
+        self.root = root    # main window, used to set the timers
+        self.clock = clock  # monotonic clock the deadlines are measured with (in seconds)
+        self.timers = {}    # maps a name to (Tk after id, deadline) of the callback waiting under that name
+        self.fired = 0  # number of callbacks that ran
+        self.cancelled = 0  # number of callbacks that were cancelled before they ran
+
+
+    def now(self):
+        # return the current time of the scheduler's clock
+        return self.clock()
+
+
+    def schedule_at(self, name, deadline, callback, *args):
+        # run callback(*args) once the clock reaches deadline, replacing the callback already waiting under name
+        # deadlines are absolute, so callbacks chained from deadline to deadline do not drift when the UI is busy
+        self.cancel(name)
+        self.arm(name, deadline, callback, args)
+        return deadline
+
+
+    def schedule(self, name, delay_ms, callback, *args):
+        # run callback(*args) delay_ms milliseconds from now, returns the deadline
+        return self.schedule_at(name, self.clock() + delay_ms / 1000, callback, *args)
+
+
+    def arm(self, name, deadline, callback, args):
+        # set a Tk timer for the time left until deadline (rounded up, Tk timers have millisecond resolution)
+        delay_ms = max(0, math.ceil((deadline - self.clock()) * 1000))
+        after_id = self.root.after(delay_ms, self.fire, name, deadline, callback, args)
+        self.timers[name] = (after_id, deadline)
+
+
+    def fire(self, name, deadline, callback, args):
+        # run a callback whose timer went off, runs on the UI thread
+        now = self.clock()
+        if now < deadline:
+            self.arm(name, deadline, callback, args)    # the timer went off early, wait for the rest
+            return
+
+        del self.timers[name]
+        latency.record(f"timer_late/{name}", now - deadline)    # how late the callback ran
+        self.fired += 1
+        callback(*args)
+
+
+    def cancel(self, name):
+        # cancel the callback waiting under name, if any
+        timer = self.timers.pop(name, None)
+        if timer is not None:
+            self.root.after_cancel(timer[0])
+            self.cancelled += 1
+
+
+    def cancel_all(self):
+        # cancel every waiting callback, e.g. when the quiz is reset
+        for name in list(self.timers):
+            self.cancel(name)
+
+
+    def remaining(self, name):
+        # return the seconds left until the callback waiting under name runs (0 if none is waiting)
+        timer = self.timers.get(name)
+        return max(0.0, timer[1] - self.clock()) if timer is not None else 0.0
+
+
+    def stats(self):
+        # return the counters as a dictionary
+        return {"fired": self.fired, "cancelled": self.cancelled, "pending": len(self.timers)}
@@ -0,0 +1,382 @@
+from country_catalog import CountryCatalog
+from country_pools import PoolIndex
+from flag_manifest import FlagManifest
+from latency_probe import percentile
+from quiz_engine import QuizEngine, generate_series
+from types import MappingProxyType
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import time
+
+# default address the server listens on
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# sessions that have not been used for this many seconds are removed
+SESSION_TIMEOUT = 30 * 60
+
+# largest request body the server accepts (in bytes)
+MAX_BODY_SIZE = 64 * 1024
+
+# reason phrases for the status codes the server sends
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+class HttpError(Exception):
+
+    # constructor
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status    # HTTP status code sent to the client
+
+
+def integer_field(body, name, default):
+    # return an optional integer field of a request body (JSON true and false are not accepted as 1 and 0)
+    value = body.get(name, default)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise HttpError(400, f"{name} must be an integer")
+    return value
+
+
+def load_flag_store(manifest):
+    # read every valid flag PNG into memory once, returns a read-only mapping of lowercase country code -> PNG bytes
+    store = {}
+    for code, entry in manifest.flags.items():
+        with open(entry["path"], "rb") as file:
+            store[code] = file.read()
+    return MappingProxyType(store)
+
+
+class QuizSession:
+
+    # only these attributes, a server keeps many sessions at once
+    __slots__ = ("session_id", "engine", "num_questions", "question", "last_seen")
+
+    # constructor, one quiz played by one client, country_ids are the countries of the region that have a flag image
+    def __init__(self, session_id, catalog, country_ids, num_answers, num_questions, seed=None):
+        self.session_id = session_id    # id the client uses in the URLs of the session
+        self.engine = QuizEngine(catalog, random.Random(seed))  # every session has its own random number generator
+        self.engine.select_pool(country_ids)    # wrong answers are drawn from the same countries, as in the game
+        self.engine.start(num_answers)
+        self.num_questions = min(num_questions, len(self.engine.country_ids))   # number of questions in this quiz
+        self.question = None    # question that is waiting for an answer
+        self.last_seen = time.monotonic()   # used to remove abandoned sessions
+
+
+    def next_question(self):
+        # ask the next question, or return None when the quiz is finished
+        if self.engine.current_question >= self.num_questions:
+            self.question = None
+            return None
+
+        self.question = self.engine.next_question(self.engine.country_ids[self.engine.current_question])
+        return {
+            "number": self.engine.current_question,
+            "flag": f"/sessions/{self.session_id}/flag", # the URL does not give the country away, it always serves the flag of the current question
+            "options": self.engine.catalog.names(self.question.options),
+        }
+
+
+    def flag_code(self):
+        # return the lowercase code of the flag of the current question
+        if self.question is None:
+            raise HttpError(404, "no question is waiting for an answer")
+        return self.engine.catalog.country_codes[self.question.country].lower()
+
+
+    def answer(self, selected_option):
+        # check an answer and return the result together with the next question or the final score
+        if self.question is None:
+            raise HttpError(400, "quiz is already finished")
+        if not 0 <= selected_option < len(self.question.options):
+            raise HttpError(400, "invalid option")
+
+        correct = self.engine.answer(selected_option)
+        result = {
+            "correct": correct,
+            "correct_answer": self.question.correct_answer,
+            "score": self.engine.score,
+            "answered": self.engine.current_question,
+        }
+
+        # attach the next question, or the final score when the quiz is finished
+        question = self.next_question()
+        if question is None:
+            result["finished"] = True
+            result["percentage"] = self.engine.percentage(self.num_questions)
+        else:
+            result["finished"] = False
+            result["question"] = question
+        return result
+
+
+class QuizServer:
+
+    # constructor, catalog and flag_store are shared (read-only) by all sessions
+    def __init__(self, catalog, flag_store):
+        self.catalog = catalog  # country catalog the questions are drawn from
+        self.flag_store = flag_store    # maps a lowercase country code to PNG bytes
+        self.pools = PoolIndex(catalog, codes=[code for code in catalog.country_codes if code.lower() in flag_store])  # regions without the countries that have no flag, as in the game
+        self.sessions = {}  # maps a session id to its QuizSession
+        self.requests = 0   # number of requests handled
+
+
+    def create_session(self, body):
+        # start a new quiz with the same options the GUI offers
+        region_name = body.get("region")
+        if not isinstance(region_name, str) or region_name not in self.catalog:
+            raise HttpError(400, f"unknown region: {region_name}")
+
+        num_answers = integer_field(body, "num_answers", 4)
+        if num_answers not in (1, 2, 3, 4):
+            raise HttpError(400, "num_answers must be 1, 2, 3 or 4")
+
+        country_ids = self.pools.select(region_name)
+        series = generate_series(len(country_ids))  # options for number of questions in the GUI
+        num_questions = integer_field(body, "num_questions", int(series[0]))
+        if str(num_questions) not in series:
+            raise HttpError(400, f"num_questions must be one of {', '.join(series)}")
+
+        seed = body.get("seed")
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, (int, str))):
+            raise HttpError(400, "seed must be an integer or a string")
+
+        session_id = secrets.token_hex(8)
+        session = QuizSession(session_id, self.catalog, country_ids, num_answers, num_questions, seed)
+        self.sessions[session_id] = session
+        return {"session": session_id, "num_questions": session.num_questions, "question": session.next_question()}
+
+
+    def answer(self, session_id, body):
+        # answer the current question of a session
+        session = self.get_session(session_id)
+        selected_option = integer_field(body, "option", None)
+
+        result = session.answer(selected_option)
+        if result["finished"]:
+            del self.sessions[session_id]   # finished sessions are not kept
+        return result
+
+
+    def get_session(self, session_id):
+        # return a running session and mark it as used
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, "unknown session")
+        session.last_seen = time.monotonic()
+        return session
+
+
+    def route(self, method, path, body):
+        # return (status, content type, payload bytes) for a request
+        parts = [part for part in path.split("?")[0].split("/") if part]
+
+        if parts == ["regions"] and method == "GET":
+            regions = {name: generate_series(self.pools.count(name)) for name in self.catalog.regions()}
+            return self.json_response({"regions": regions})
+
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "flag" and method == "GET":
+            return 200, "image/png", self.flag_store[self.get_session(parts[1]).flag_code()]
+
+        if parts == ["sessions"] and method == "POST":
+            return self.json_response(self.create_session(self.parse_json(body)))
+
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "answer" and method == "POST":
+            return self.json_response(self.answer(parts[1], self.parse_json(body)))
+
+        if len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+            self.sessions.pop(parts[1], None)
+            return self.json_response({})
+
+        raise HttpError(404, "not found")
+
+
+    def parse_json(self, body):
+        # decode a JSON object from a request body
+        try:
+            value = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HttpError(400, "body is not valid JSON")
+        if not isinstance(value, dict):
+            raise HttpError(400, "body must be a JSON object")
+        return value
+
+
+    def json_response(self, value):
+        # encode a JSON response
+        return 200, "application/json", json.dumps(value).encode()
+
+
+    async def handle_connection(self, reader, writer):
+        # serve requests on one keep-alive connection until the client closes it
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break   # connection closed
+
+                # read the request line and headers
+                method, path, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                # read the body and handle the request
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY_SIZE:
+                        raise HttpError(413, "request body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, content_type, payload = self.route(method, path, body)
+                except HttpError as e:
+                    status, content_type, payload = e.status, "application/json", json.dumps({"error": str(e)}).encode()
+                except ValueError:
+                    status, content_type, payload = 400, "application/json", b'{"error": "bad request"}'
+                self.requests += 1
+
+                # send the response
+                keep_alive = headers.get("connection", "").lower() != "close" and not version.startswith("HTTP/1.0")
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass    # client went away or sent garbage, drop the connection
+        finally:
+            writer.close()
+
+
+    async def purge_sessions(self):
+        # remove abandoned sessions every minute
+        while True:
+            await asyncio.sleep(60)
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if now - session.last_seen > SESSION_TIMEOUT:
+                    del self.sessions[session_id]
+
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        # accept connections until cancelled
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        purge_task = asyncio.create_task(self.purge_sessions())
+        print(f"Serving Country Flags quizzes on http://{host}:{port} ({len(self.flag_store)} flags, {len(self.catalog.regions())} regions)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            purge_task.cancel()
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, data_file="AllCountries.json"):
+    # load the shared catalog and flags once and run the server
+    manifest = FlagManifest.load()
+    manifest.report_bad()   # report bad images before any session can ask for them
+    server = QuizServer(CountryCatalog.from_file(data_file), load_flag_store(manifest))
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+async def request(reader, writer, method, path, body=None):
+    # send one HTTP request on a keep-alive connection and return (status, decoded JSON body)
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    data = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, json.loads(data) if headers.get("content-type") == "application/json" else data
+
+
+async def play_sessions(host, port, regions, sessions, rng, round_trips):
+    # play quizzes one after another on one connection, answering randomly, and record every answer round trip
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(sessions):
+            region_name = rng.choice(list(regions))
+            options = {"region": region_name, "num_answers": rng.randint(1, 4), "num_questions": int(rng.choice(regions[region_name]))}
+            status, result = await request(reader, writer, "POST", "/sessions", options)
+            if status != 200:
+                raise RuntimeError(f"could not start a session: {result}")
+            session_id = result["session"]
+            question = result["question"]
+
+            while question is not None:
+                started = time.perf_counter()
+                status, result = await request(reader, writer, "POST", f"/sessions/{session_id}/answer", {"option": rng.randrange(len(question["options"]))})
+                round_trips.append(time.perf_counter() - started)
+                if status != 200:
+                    raise RuntimeError(f"answer failed: {result}")
+                question = result.get("question")
+    finally:
+        writer.close()
+
+
+async def load_test(host, port, sessions, concurrency, seed):
+    # run sessions quizzes over concurrency connections and report throughput and answer latency
+    rng = random.Random(seed)
+    round_trips = []    # seconds per answer round trip
+    per_client = [sessions // concurrency + (1 if index < sessions % concurrency else 0) for index in range(concurrency)]
+
+    # ask the server which regions and numbers of questions it offers
+    reader, writer = await asyncio.open_connection(host, port)
+    regions = (await request(reader, writer, "GET", "/regions"))[1]["regions"]
+    writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(play_sessions(host, port, regions, count, random.Random(rng.random()), round_trips) for count in per_client if count))
+    elapsed = time.perf_counter() - started
+
+    round_trips.sort()
+    print(f"Played {sessions} sessions ({len(round_trips)} answers) over {concurrency} connections in {elapsed:.2f}s")
+    print(f"Throughput: {sessions / elapsed:.1f} sessions/sec, {len(round_trips) / elapsed:.0f} answers/sec")
+    print(f"Answer round trip: p50 {percentile(round_trips, 0.50) * 1000:.2f} ms, p95 {percentile(round_trips, 0.95) * 1000:.2f} ms, p99 {percentile(round_trips, 0.99) * 1000:.2f} ms")
+
+
+def main(argv=None):
+    # command line entry point
+    parser = argparse.ArgumentParser(description="Multi-session Country Flags Game server.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="run the quiz server")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--data", default="AllCountries.json", help="path to the country data file")
+
+    load_parser = subparsers.add_parser("loadgen", help="play many quizzes against a running server")
+    load_parser.add_argument("--host", default=DEFAULT_HOST)
+    load_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    load_parser.add_argument("--sessions", type=int, default=1000, help="number of quizzes to play")
+    load_parser.add_argument("--concurrency", type=int, default=50, help="number of simultaneous connections")
+    load_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port, args.data)
+    else:
+        asyncio.run(load_test(args.host, args.port, args.sessions, args.concurrency, args.seed))
+
+
+if __name__ == "__main__":
+    main()
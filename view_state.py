@@ -0,0 +1,107 @@
+from latency_probe import latency
+
+# grid options of a widget that is not shown
+HIDDEN = None
+
+# marks that no grid change is pending
+UNCHANGED = object()
+
+
+class WidgetView:
+
+    # constructor, properties are the values the widget was created with
+    def __init__(self, batch, widget, **properties):
+        self.batch = batch  # batch that applies the changes of this view
+        self.widget = widget    # CTk widget this view updates
+        self.properties = dict(properties)  # properties the widget currently has
+        self.pending = {}   # properties that differ from self.properties and still have to be applied
+        self.grid_options = HIDDEN  # grid options the widget currently has (HIDDEN if not shown)
+        self.pending_grid = UNCHANGED   # grid options still to be applied
+
+
+    def set(self, **properties):
+        # request new property values, only values that differ from the widget's current ones are applied
+        self.batch.requested += 1
+        for name, value in properties.items():
+            if name in self.properties and self.properties[name] == value:
+                self.pending.pop(name, None)    # back to the current value, nothing to do
+            else:
+                self.pending[name] = value
+        self.batch.schedule()
+
+
+    def grid(self, **options):
+        # request that the widget is shown with the given grid options
+        self.batch.requested += 1
+        self.pending_grid = UNCHANGED if options == self.grid_options else options
+        self.batch.schedule()
+
+
+    def grid_forget(self):
+        # request that the widget is hidden
+        self.batch.requested += 1
+        self.pending_grid = UNCHANGED if self.grid_options is HIDDEN else HIDDEN
+        self.batch.schedule()
+
+
+    def flush(self):
+        # apply all pending changes with as few widget calls as possible
+        if self.pending:
+            self.widget.configure(**self.pending)   # one redraw for all changed properties
+            self.properties.update(self.pending)
+            self.pending = {}
+            self.batch.applied += 1
+
+        if self.pending_grid is not UNCHANGED:
+            if self.grid_options is not HIDDEN:
+                self.widget.grid_forget()   # forget first so options from the old position do not carry over
+                self.batch.applied += 1
+            if self.pending_grid is not HIDDEN:
+                self.widget.grid(**self.pending_grid)
+                self.batch.applied += 1
+            self.grid_options = self.pending_grid
+            self.pending_grid = UNCHANGED
+
+
+class ViewBatch:
+
+    # constructor
+    def __init__(self, root):
+        self.root = root    # main window, used to schedule the flush
+        self.views = [] # views whose changes are applied together
+        self.scheduled = False  # True while a flush is scheduled
+        self.requested = 0  # number of configure/grid calls requested
+        self.applied = 0    # number of configure/grid calls actually made
+
+
+    def add(self, widget, **properties):
+        # create a view for a widget, properties are the values it was created with
+        view = WidgetView(self, widget, **properties)
+        self.views.append(view)
+        return view
+
+
+    def schedule(self):
+        # apply the pending changes once the current Tk callback has finished
+        if not self.scheduled:
+            self.scheduled = True
+            self.root.after_idle(self.flush)
+
+
+    def flush(self):
+        # apply the pending changes of every view now
+        started = latency.begin()
+        self.scheduled = False
+        for view in self.views:
+            view.flush()
+        latency.end("view_flush", started)
+
+
+    def saved(self):
+        # number of widget calls (and redraws) that were skipped because nothing changed or changes were merged
+        return self.requested - self.applied
+
+
+    def stats(self):
+        # return the counters as a dictionary
+        return {"requested": self.requested, "applied": self.applied, "saved": self.saved()}